@@ -0,0 +1,226 @@
+"""
+Admission control for upstream calls (Algolia, OpenAI).
+
+Each upstream has a `Scheduler`: at most `concurrency` calls in flight, started no faster than its
+token bucket allows, and a bounded queue for the rest, served by priority (interactive requests before
+batch items) and then in arrival order. A call is shed with `Overloaded` instead of queued when its
+wait would outlast the request's deadline, or when the queue is full of calls that rank as high.
+Extra calls that only speed a request up, like hedges, take a slot with `try_acquire` or are skipped.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from .deadline import remaining
+from .metrics import admission_shed, admission_wait, register_scheduler
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Priority of the current request's upstream calls; batch items lower it for their own task
+_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+
+
+def set_priority(priority: int):
+    _priority.set(priority)
+
+
+class Overloaded(Exception):
+    """
+    An upstream call shed by admission control. `status` is what the endpoint answers: 429 when the
+    queue is full or the rate limit is ahead of the deadline, 503 when the wait would outlast the deadline.
+    """
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = 503 if reason == "deadline" else 429
+        super().__init__(f"{upstream} is overloaded ({reason}); retry after {retry_after:.1f}s")
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` saved up; a rate of 0 or less never limits."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, n: float = 1.0) -> float:
+        """Seconds until `n` tokens are available."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (n - self.tokens) / self.rate)
+
+    def take(self) -> float:
+        """Take a token now, or reserve the next one: returns the seconds to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def give_back(self):
+        if self.rate > 0:
+            self.tokens += 1
+
+
+class Scheduler:
+    """Concurrency limit, rate limit and priority queue in front of one upstream."""
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        rate: float = 0.0,
+        burst: float = 1.0,
+        max_queue: int = 256,
+        min_budget: float = 0.0
+    ):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.max_queue = max_queue
+        # A call needs this much of the deadline left once admitted (the upstream's own minimum)
+        self.min_budget = min_budget
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.depth: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        # Heap of [priority, arrival, future]; futures of waiters that gave up stay until popped
+        self._queue: List[list] = []
+        self._arrivals = itertools.count()
+        # Moving average of how long a call holds its slot, for estimating queue waits
+        self._service: Optional[float] = None
+        register_scheduler(self)
+
+    def estimated_wait(self, priority: int) -> float:
+        """Seconds a call of `priority` arriving now would wait for a slot and a token."""
+        ahead = sum(n for p, n in self.depth.items() if p <= priority)
+        wait = self.bucket.delay(ahead + 1)
+        if self.in_flight + ahead >= self.concurrency and self._service is not None:
+            wait = max(wait, (ahead // self.concurrency + 1) * self._service)
+        return wait
+
+    def _patience(self) -> Optional[float]:
+        left = remaining()
+        return None if left is None else left - self.min_budget
+
+    def _overloaded(self, reason: str, priority: int, retry_after: Optional[float] = None) -> Overloaded:
+        self.shed += 1
+        admission_shed.inc(upstream=self.name, reason=reason)
+        if retry_after is None:
+            retry_after = self.estimated_wait(priority)
+        return Overloaded(self.name, reason, max(retry_after, self._service or 0.0))
+
+    def _make_room(self, priority: int):
+        """Evict the newest waiter of the lowest priority below `priority`, or shed this call."""
+        lowest = max((p for p, n in self.depth.items() if n), default=priority)
+        if lowest <= priority:
+            raise self._overloaded("queue_full", priority)
+        victim = max((entry for entry in self._queue if entry[0] == lowest and not entry[2].done()), key=lambda e: e[1])
+        self.depth[lowest] -= 1
+        victim[2].set_exception(self._overloaded("queue_full", lowest))
+
+    async def acquire(self, priority: int):
+        start = time.monotonic()
+        patience = self._patience()
+        if self.in_flight < self.concurrency:
+            self.in_flight += 1
+        else:
+            wait = self.estimated_wait(priority)
+            if patience is not None and wait > patience:
+                raise self._overloaded("deadline", priority, wait)
+            if sum(self.depth.values()) >= self.max_queue:
+                self._make_room(priority)
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, [priority, next(self._arrivals), future])
+            self.depth[priority] += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(future), patience)
+            except asyncio.TimeoutError:
+                self._abandon(priority, future)
+                raise self._overloaded("deadline", priority)
+            except asyncio.CancelledError:
+                self._abandon(priority, future)
+                raise
+
+        delay = self.bucket.take()
+        if delay > 0:
+            patience = self._patience()
+            if patience is not None and delay > patience:
+                self.bucket.give_back()
+                self._release()
+                raise self._overloaded("rate_limit", priority, delay)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._release()
+                raise
+        self.admitted += 1
+        admission_wait.observe(time.monotonic() - start, upstream=self.name, priority=PRIORITY_NAMES[priority])
+
+    def try_acquire(self) -> Optional[Callable[[], None]]:
+        """
+        Take a slot and a token for an extra call (a hedge) if both are free right now and no call
+        is queued for them. Returns the function that gives the slot back, or None; never waits.
+        """
+        if self.in_flight >= self.concurrency or any(self.depth.values()) or self.bucket.delay() > 0:
+            return None
+        self.in_flight += 1
+        self.bucket.take()
+        self.admitted += 1
+        return self._release
+
+    def _abandon(self, priority: int, future: asyncio.Future):
+        if not future.done():
+            future.cancel()
+            self.depth[priority] -= 1
+        elif not future.cancelled() and future.exception() is None:
+            # The slot was handed over just as the waiter gave up: pass it on
+            self._release()
+
+    def _release(self):
+        while self._queue:
+            priority, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self.depth[priority] -= 1
+            # The slot goes straight to the waiter, so in_flight is unchanged
+            future.set_result(None)
+            return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None) -> AsyncIterator[None]:
+        """Hold one of the upstream's slots, at the current request's priority unless given."""
+        await self.acquire(_priority.get() if priority is None else priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - start
+            self._service = held if self._service is None else 0.8 * self._service + 0.2 * held
+            self._release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "in_flight": self.in_flight,
+            "queued": {PRIORITY_NAMES[p]: n for p, n in self.depth.items()},
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
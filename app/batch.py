@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from fastapi import HTTPException
+
+from .schemas import RecommendRequest
+from .admission import BATCH, set_priority
+from .intent import extract_slots
+from .pipeline import get_context, recommend_for, start_request_deadline
+
+
+def _prepare(req: RecommendRequest) -> Tuple[str, List[Dict[str, str]], Dict[str, Any]]:
+    user_text, messages = get_context(req)
+    return user_text, messages, extract_slots(user_text)
+
+
+async def _run_one(index: int, req: RecommendRequest) -> Dict[str, Any]:
+    """One batch item; its errors are returned, not raised, so they never stop the batch."""
+    try:
+        user_text, messages, slots = _prepare(req)
+        # Each item's deadline starts when a worker picks it up, not while it queues
+        start_request_deadline(req)
+        response, conversational_response = await recommend_for(req, user_text, messages, slots)
+    except HTTPException as e:
+        return {"index": index, "ok": False, "error": e.detail}
+    except Exception as e:
+        return {"index": index, "ok": False, "error": f"{type(e).__name__}: {e}"}
+    return {
+        "index": index,
+        "ok": True,
+        "response": response.model_dump(),
+        "conversational_response": conversational_response
+    }
+
+
+async def run_batch(
+    requests: List[RecommendRequest],
+    concurrency: int = 8,
+    ordered: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Recommend for many requests with `concurrency` workers, each running one request at a time.
+    Yields {"index", "ok", "response" | "error"} per request, in input order or as each completes.
+    """
+    items = iter(enumerate(requests))
+    # Bounded, so workers wait for a slow reader instead of piling up results
+    done: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+
+    async def worker():
+        # Upstream calls of batch items queue behind those of interactive requests
+        set_priority(BATCH)
+        for index, req in items:
+            await done.put(await _run_one(index, req))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(concurrency, len(requests)))]
+    waiting: Dict[int, Dict[str, Any]] = {}
+    next_index = 0
+    try:
+        for _ in range(len(requests)):
+            result = await done.get()
+            if not ordered:
+                yield result
+                continue
+            waiting[result["index"]] = result
+            while next_index in waiting:
+                yield waiting.pop(next_index)
+                next_index += 1
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+def read_jsonl(path: str) -> List[RecommendRequest]:
+    requests = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                requests.append(RecommendRequest.model_validate_json(line))
+    return requests
+
+
+async def _main(args):
+    requests = read_jsonl(args.input)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        async for result in run_batch(requests, concurrency=args.concurrency, ordered=not args.unordered):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run /recommend over a JSONL file of RecommendRequest objects.")
+    parser.add_argument("input", help="JSONL file, one RecommendRequest per line")
+    parser.add_argument("-o", "--output", help="Write JSONL results here instead of stdout")
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--unordered", action="store_true", help="Emit results as they complete")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import logging
+from typing import List
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+logger = logging.getLogger(__name__)
+
+
+class BM25Engine:
+    """
+    Okapi BM25 over precomputed per-document term weights.
+    The weights are stored as a CSC matrix so scoring a query is a single sparse
+    matrix-vector product that only touches the columns of the query's terms.
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.vectorizer = CountVectorizer(lowercase=True, token_pattern=r"(?u)\b\w+\b", dtype=np.float32)
+        tf = self.vectorizer.fit_transform(texts).tocsr()
+        n_docs, n_terms = tf.shape
+
+        df = np.bincount(tf.indices, minlength=n_terms)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if n_docs else 0.0
+        norm = k1 * (1 - b + b * doc_len / (avg_len or 1.0))
+        rows = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+
+        weights = idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + norm[rows])
+        self.matrix = sparse.csr_matrix((weights.astype(np.float32), tf.indices, tf.indptr), shape=tf.shape).tocsc()
+        logger.info(f"BM25 matrix built: {n_docs} docs, {n_terms} terms, {self.matrix.nnz} weights")
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for `query` (zero when no query term occurs)."""
+        q = self.vectorizer.transform([query])
+        if q.nnz == 0:
+            return np.zeros(self.matrix.shape[0], dtype=np.float32)
+        return (self.matrix @ q.T).toarray().ravel()
@@ -0,0 +1,198 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class CacheBackend:
+    """
+    Storage behind a `Cache`. Subclass it to share entries between workers (e.g. Redis);
+    values handed to a backend are JSON-serializable.
+    """
+
+    def get(self, key: str) -> Any:
+        """Return the stored value, or None when the key is absent or expired."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskBackend(CacheBackend):
+    """Persistent tier in a SQLite file; survives restarts and can be shared by workers on one host."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value TEXT)")
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT expires, value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        expires, value = row
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, expires, value) VALUES (?, ?, ?)",
+                (key, expires, json.dumps(value))
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def purge_expired(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE expires IS NULL OR expires > ?", (time.time(),)
+            ).fetchone()
+        return row[0]
+
+
+class TieredBackend(CacheBackend):
+    """A bounded front tier (normally memory) over a larger back tier; back-tier hits are promoted."""
+
+    def __init__(self, front: CacheBackend, back: CacheBackend, promote_ttl: Optional[float] = None):
+        self.front = front
+        self.back = back
+        self.promote_ttl = promote_ttl
+
+    def get(self, key: str) -> Any:
+        value = self.front.get(key)
+        if value is None:
+            value = self.back.get(key)
+            if value is not None:
+                self.front.set(key, value, self.promote_ttl)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        self.front.set(key, value, ttl)
+        self.back.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.front.delete(key)
+        self.back.delete(key)
+
+    def clear(self) -> None:
+        self.front.clear()
+        self.back.clear()
+
+
+class Cache:
+    """TTL cache over a pluggable backend, with hit/miss counters."""
+
+    def __init__(self, name: str, backend: Optional[CacheBackend] = None, ttl: Optional[float] = None,
+                 maxsize: int = 1024, enabled: bool = True):
+        self.name = name
+        self.backend = backend if backend is not None else MemoryBackend(maxsize)
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if not self.enabled:
+            return default
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        # Callers mutate what they get back (rerank annotates hits), so never hand out the stored object
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any) -> None:
+        if self.enabled:
+            self.backend.set(key, copy.deepcopy(value), self.ttl)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def make_key(*parts: Any) -> str:
+    """Stable hash of JSON-serializable parts."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
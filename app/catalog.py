@@ -0,0 +1,479 @@
+import json
+import logging
+import os
+import threading
+from functools import lru_cache
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import settings
+from .topk import top_k_desc
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ["name", "title", "brand", "categories", "description", "shortDescription"]
+# What a hit carries, as requested from Algolia with attributesToRetrieve
+ATTRIBUTES_TO_RETRIEVE = [
+    "name", "title", "price", "brand", "categories", "image", "url",
+    "objectID", "description", "shortDescription", "rating", "weight",
+    "os", "ram", "storage", "camera", "cpu", "gpu"
+]
+# Attributes also kept as float columns (NaN when missing or not a number)
+NUMERIC_FIELDS = ("price", "ram", "rating")
+
+# Filter key -> catalog attribute it must match, the same facets AlgoliaRetriever filters on
+FACET_FILTERS = (("brand", "brand"), ("os", "os"), ("device_type", "categories"))
+# Bounds Algolia's numericFilters get when only one side of the budget is set
+PRICE_FLOOR = 0
+PRICE_CEILING = 10**9
+
+
+def item_text(item: Dict[str, Any]) -> str:
+    # Same lowercase blob the original per-request scan matched query tokens against
+    return " ".join([str(item.get(k, "")) for k in SEARCH_FIELDS]).lower()
+
+
+def facet_values(value: Any) -> List[str]:
+    """Facet values of an attribute, lowercased: Algolia matches facet filters case-insensitively."""
+    if value is None:
+        return []
+    values = value if isinstance(value, list) else [value]
+    return [str(v).lower() for v in values if v is not None]
+
+
+class CatalogIndex:
+    """
+    Process-wide index over the local catalog.
+    A query token matches an item when it is a substring of the item's text blob; since tokens
+    never contain whitespace, that is the same as being a substring of one whitespace-separated
+    term, so we index terms and resolve each query token against the (much smaller) vocabulary.
+    Filters are resolved first, from per-value sorted item ids and a price-sorted id array.
+    Everything is held in flat arrays so a prebuilt index can be memory-mapped (see app.compact);
+    `items` is then a lazy view that decodes a hit only when it is returned.
+    """
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        columns = {
+            name: np.array([_number(item.get(name)) for item in items], dtype=np.float64)
+            for name in NUMERIC_FIELDS
+        }
+
+        facets: Dict[str, Tuple[List[str], np.ndarray, np.ndarray]] = {}
+        for field in sorted({field for _, field in FACET_FILTERS}):
+            ids_by_value: Dict[str, List[int]] = {}
+            for i, item in enumerate(items):
+                for value in facet_values(item.get(field)):
+                    ids_by_value.setdefault(value, []).append(i)
+            values = sorted(ids_by_value)
+            # Sorted item ids per value, laid out like the postings: value k's ids are
+            # ids[ptr[k]:ptr[k + 1]]; 4 bytes per item and value however many values a facet has
+            ptr = np.zeros(len(values) + 1, dtype=np.int64)
+            for k, value in enumerate(values):
+                ptr[k + 1] = ptr[k] + len(ids_by_value[value])
+            ids = np.fromiter((i for value in values for i in ids_by_value[value]), dtype=np.int32, count=int(ptr[-1]))
+            facets[field] = (values, ptr, ids)
+
+        postings: Dict[str, List[int]] = {}
+        for i, item in enumerate(items):
+            for term in set(item_text(item).split()):
+                postings.setdefault(term, []).append(i)
+        vocab = sorted(postings)
+        # All terms in one newline-joined blob so a token lookup is a handful of C-level str.find calls;
+        # term j starts at vocab_starts[j], and its ids are postings_ids[postings_ptr[j]:postings_ptr[j + 1]]
+        vocab_starts = np.zeros(len(vocab) + 1, dtype=np.int64)
+        postings_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for j, term in enumerate(vocab):
+            vocab_starts[j + 1] = vocab_starts[j] + len(term) + 1
+            postings_ptr[j + 1] = postings_ptr[j] + len(postings[term])
+        postings_ids = np.fromiter((i for term in vocab for i in postings[term]), dtype=np.int32, count=int(postings_ptr[-1]))
+
+        self._attach(items, columns, facets, "\n".join(vocab), vocab_starts, postings_ptr, postings_ids)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        items: Sequence[Dict[str, Any]],
+        columns: Dict[str, np.ndarray],
+        facets: Dict[str, Tuple[List[str], np.ndarray, np.ndarray]],
+        vocab_blob: str,
+        vocab_starts: np.ndarray,
+        postings_ptr: np.ndarray,
+        postings_ids: np.ndarray,
+        price_order: Optional[np.ndarray] = None,
+        sorted_prices: Optional[np.ndarray] = None
+    ) -> "CatalogIndex":
+        index = cls.__new__(cls)
+        index._attach(items, columns, facets, vocab_blob, vocab_starts, postings_ptr, postings_ids, price_order, sorted_prices)
+        return index
+
+    def _attach(self, items, columns, facets, vocab_blob, vocab_starts, postings_ptr, postings_ids,
+                price_order=None, sorted_prices=None):
+        self.items = items
+        self.columns = columns
+        self.price_array = columns["price"]
+        # Item ids by ascending price (unpriced items, NaN, sort last) for range lookups with bisect
+        self.price_order = np.argsort(self.price_array, kind="stable") if price_order is None else price_order
+        self.sorted_prices = self.price_array[self.price_order] if sorted_prices is None else sorted_prices
+        self._n_priced = int(np.count_nonzero(~np.isnan(self.price_array)))
+
+        self.facet_tables = facets
+        self.facets: Dict[str, Dict[str, np.ndarray]] = {
+            field: {value: ids[ptr[k]:ptr[k + 1]] for k, value in enumerate(values)}
+            for field, (values, ptr, ids) in facets.items()
+        }
+
+        self._vocab_blob = vocab_blob
+        self._vocab_starts = vocab_starts
+        self._postings_ptr = postings_ptr
+        self._postings_ids = postings_ids
+        self.n_terms = len(vocab_starts) - 1
+
+        self.token_ids = lru_cache(maxsize=4096)(self._resolve_token)
+        self._bm25 = None
+        self._bm25_lock = threading.Lock()
+        self._dense = None
+        self._dense_lock = threading.Lock()
+        # Rows removed by a delta stay in the arrays and are masked out of every search
+        self.live: Optional[np.ndarray] = None
+        self._rows: Optional[Dict[str, int]] = None
+        self._rows_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _resolve_token(self, token: str) -> np.ndarray:
+        """Sorted ids of the items whose text contains `token`."""
+        blob = self._vocab_blob
+        segments = []
+        pos = blob.find(token)
+        while pos != -1:
+            j = int(np.searchsorted(self._vocab_starts, pos, side="right")) - 1
+            segments.append(self._postings_ids[self._postings_ptr[j]:self._postings_ptr[j + 1]])
+            # Skip to the next term; further matches inside this one add nothing
+            pos = blob.find(token, int(self._vocab_starts[j + 1]))
+        if not segments:
+            return np.zeros(0, dtype=np.int32)
+        return np.unique(np.concatenate(segments))
+
+    def term_id(self, term: str) -> Optional[int]:
+        """Position of `term` in the sorted vocabulary, or None when no item has it."""
+        blob, starts = self._vocab_blob, self._vocab_starts
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[int(starts[mid]):int(starts[mid + 1]) - 1] < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and blob[int(starts[lo]):int(starts[lo + 1]) - 1] == term:
+            return lo
+        return None
+
+    def candidates(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Boolean mask of the items passing `filters` as AlgoliaRetriever would send them, or None when
+        nothing is filtered: facet values must match exactly (ignoring case), and a budget keeps only
+        priced items within [budget_min or 0, budget_max or 1e9].
+        """
+        if not filters:
+            return self.live
+        mask = None
+        for key, field in FACET_FILTERS:
+            if not filters.get(key):
+                continue
+            ids = self.facets[field].get(str(filters[key]).lower())
+            if ids is None:
+                return np.zeros(len(self.items), dtype=bool)
+            matches = np.zeros(len(self.items), dtype=bool)
+            matches[ids] = True
+            mask = matches if mask is None else mask & matches
+
+        bmin = filters.get("budget_min")
+        bmax = filters.get("budget_max")
+        if bmin is not None or bmax is not None:
+            priced = self.sorted_prices[:self._n_priced]
+            lo = np.searchsorted(priced, PRICE_FLOOR if bmin is None else bmin, side="left")
+            hi = np.searchsorted(priced, PRICE_CEILING if bmax is None else bmax, side="right")
+            in_range = np.zeros(len(self.items), dtype=bool)
+            in_range[self.price_order[lo:hi]] = True
+            mask = in_range if mask is None else mask & in_range
+        if self.live is not None:
+            mask = self.live if mask is None else mask & self.live
+        return mask
+
+    def row_of(self, object_id: str) -> Optional[int]:
+        """Row of the item with `object_id`, removed or not."""
+        if self._rows is None:
+            with self._rows_lock:
+                if self._rows is None:
+                    if isinstance(self.items, list):
+                        ids = (item.get("objectID") for item in self.items)
+                    else:
+                        ids = (self.items.get(i, ["objectID"]).get("objectID") for i in range(len(self.items)))
+                    self._rows = {str(object_id): i for i, object_id in enumerate(ids)}
+        return self._rows.get(str(object_id))
+
+    def patched(self, updates: Dict[int, Dict[str, Any]], removed: Iterable[int] = ()) -> "CatalogIndex":
+        """
+        Copy with the items at the rows in `updates` replaced and the rows in `removed` hidden.
+        The token index, facets and BM25 engine are shared, so no replaced item may change its
+        indexed text or facets (see `apply_delta`); only the numeric columns are rebuilt.
+        """
+        if isinstance(self.items, list):
+            items = list(self.items)
+            for row, item in updates.items():
+                items[row] = item
+        else:
+            items = self.items.with_updates(updates)
+        columns = {}
+        for name, column in self.columns.items():
+            column = np.array(column)
+            for row, item in updates.items():
+                column[row] = _number(item.get(name))
+            columns[name] = column
+
+        index = CatalogIndex.from_arrays(
+            items, columns, self.facet_tables, self._vocab_blob,
+            self._vocab_starts, self._postings_ptr, self._postings_ids
+        )
+        live = np.ones(len(items), dtype=bool) if self.live is None else self.live.copy()
+        live[list(updates)] = True
+        live[list(removed)] = False
+        index.live = None if live.all() else live
+        index._rows = self._rows
+        index._bm25 = self._bm25
+        index._dense = self._dense
+        return index
+
+    @property
+    def bm25(self):
+        """BM25 engine over the same fields, built on first use."""
+        if self._bm25 is None:
+            with self._bm25_lock:
+                if self._bm25 is None:
+                    from .bm25 import BM25Engine
+                    self._bm25 = BM25Engine([item_text(self.items[i]) for i in range(len(self.items))],
+                                            k1=settings.BM25_K1, b=settings.BM25_B)
+        return self._bm25
+
+    @property
+    def dense(self):
+        """Hashed n-gram embeddings of the items (see app.embeddings), built on first use unless loaded."""
+        if self._dense is None:
+            with self._dense_lock:
+                if self._dense is None:
+                    from .embeddings import DenseIndex
+                    vocab = self._vocab_blob.split("\n") if self.n_terms else []
+                    self._dense = DenseIndex.build(vocab, self._postings_ptr, self._postings_ids, len(self.items),
+                                                   settings.EMBEDDING_DIM, self.term_id)
+        return self._dense
+
+    def search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        hits_per_page: int,
+        mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        mode = mode or settings.LOCAL_SEARCH_MODE
+        if mode == "bm25":
+            return self._search_bm25(query, filters, hits_per_page)
+        if mode == "hybrid":
+            return self._search_hybrid(query, filters, hits_per_page)
+        if mode != "token":
+            raise ValueError(f"Unknown local search mode: {mode}")
+
+        # Score = number of query tokens (repeats included) found in the item's text; filtered-out
+        # items are dropped from each token's ids before counting
+        mask = self.candidates(filters)
+        ids = [self.token_ids(token) for token in query.lower().split()]
+        if mask is not None:
+            ids = [t[mask[t]] for t in ids]
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int32)
+
+        if len(ids) > len(self.items) // 8:
+            counts = np.bincount(ids, minlength=len(self.items))
+            matched = np.flatnonzero(counts)
+            counts = counts[matched]
+        else:
+            matched, counts = np.unique(ids, return_counts=True)
+
+        # Highest score first, catalog order among ties (matches the old stable sort); `matched` is ascending
+        top = top_k_desc(counts, hits_per_page)
+        hits = [{"_highlightResult": {}, **self.items[matched[j]], "_score": int(counts[j])} for j in top]
+        return {"hits": hits, "nbHits": int(len(matched))}
+
+    def _search_bm25(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        hits_per_page: int
+    ) -> Dict[str, Any]:
+        scores = self.bm25.scores(query)
+        keep = scores > 0
+        mask = self.candidates(filters)
+        if mask is not None:
+            keep &= mask
+
+        candidates = np.flatnonzero(keep)
+        top = top_k_desc(scores, hits_per_page, candidates)
+        hits = [{"_highlightResult": {}, **self.items[i], "_score": float(scores[i])} for i in top]
+        return {"hits": hits, "nbHits": int(len(candidates))}
+
+    def _search_hybrid(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        hits_per_page: int
+    ) -> Dict[str, Any]:
+        """
+        Token matches fused with embedding similarity: HYBRID_ALPHA * cosine + (1 - HYBRID_ALPHA) * the
+        share of query tokens found. Items match on either signal; the dense one needs a cosine of at
+        least HYBRID_MIN_SIMILARITY. `_score` is scaled to 0-10 like a token count, which rerank expects.
+        """
+        tokens = query.lower().split()
+        if not tokens:
+            return {"hits": [], "nbHits": 0}
+        n = len(self.items)
+        ids = np.concatenate([self.token_ids(token) for token in tokens])
+        lexical = np.bincount(ids, minlength=n).astype(np.float32) / len(tokens)
+        query_vector = self.dense.embed([query])
+        mask = self.candidates(filters)
+        if mask is not None and mask.sum() < n // 2:
+            # Selective filters: only score the items they let through
+            rows = np.flatnonzero(mask)
+            dense = np.zeros(n, dtype=np.float32)
+            dense[rows] = self.dense.scores(query_vector, rows)[:, 0]
+        else:
+            dense = self.dense.scores(query_vector)[:, 0]
+
+        keep = (lexical > 0) | (dense >= settings.HYBRID_MIN_SIMILARITY)
+        if mask is not None:
+            keep &= mask
+        alpha = settings.HYBRID_ALPHA
+        fused = alpha * np.maximum(dense, 0.0) + (1 - alpha) * lexical
+
+        candidates = np.flatnonzero(keep)
+        top = top_k_desc(fused, hits_per_page, candidates)
+        hits = [{"_highlightResult": {}, **self.items[i], "_score": round(float(fused[i]) * 10, 4)} for i in top]
+        return {"hits": hits, "nbHits": int(len(candidates))}
+
+
+def _number(value: Any) -> float:
+    if value is None or isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _indexed(item: Dict[str, Any]) -> tuple:
+    """What the token index and facets hold for an item."""
+    return item_text(item), tuple(tuple(facet_values(item.get(field))) for _, field in FACET_FILTERS)
+
+
+def apply_delta(index: CatalogIndex, delta: Dict[str, Any]) -> CatalogIndex:
+    """
+    New index with `delta` applied: {"upsert": [items], "delete": [objectIDs]}, deletes first.
+    When every upsert replaces an existing item without touching its indexed text or facets
+    (a price, rating or stock change), a patched copy shares the index arrays; new items or
+    changed text rebuild the index from the merged items.
+    """
+    updates: Dict[int, Dict[str, Any]] = {}
+    removed = set()
+    added: Dict[str, Dict[str, Any]] = {}
+    for object_id in delta.get("delete") or []:
+        row = index.row_of(object_id)
+        if row is not None:
+            removed.add(row)
+    for item in delta.get("upsert") or []:
+        if item.get("objectID") is None:
+            raise ValueError("Every upserted item needs an objectID")
+        row = index.row_of(item["objectID"])
+        if row is None:
+            added[str(item["objectID"])] = item
+        else:
+            updates[row] = item
+            removed.discard(row)
+
+    if not added and all(_indexed(index.items[row]) == _indexed(item) for row, item in updates.items()):
+        return index.patched(updates, removed)
+
+    live = index.live
+    items = []
+    for i in range(len(index)):
+        if i in updates:
+            items.append(updates[i])
+        elif i not in removed and (live is None or live[i]):
+            items.append(index.items[i])
+    items.extend(added.values())
+    return CatalogIndex(items)
+
+
+def load_delta(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        delta = json.load(f)
+    if not isinstance(delta, dict):
+        raise ValueError(f"{path}: a delta is an object with \"upsert\" and/or \"delete\" lists")
+    return delta
+
+
+_indexes: Dict[str, CatalogIndex] = {}
+_lock = threading.Lock()
+_generation = 0
+
+
+def load_catalog(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_index(path: str) -> CatalogIndex:
+    """Index for `path`, a JSON catalog or a compact catalog directory."""
+    if os.path.isdir(path):
+        from .compact import load_compact
+        index = load_compact(path)
+    else:
+        index = CatalogIndex(load_catalog(path))
+    logger.info(f"Catalog index ready for {path}: {len(index)} items, {index.n_terms} terms")
+    if settings.LOCAL_SEARCH_MODE == "bm25":
+        _ = index.bm25
+    elif settings.LOCAL_SEARCH_MODE == "hybrid":
+        _ = index.dense
+    return index
+
+
+def get_catalog_index(path: Optional[str] = None) -> CatalogIndex:
+    """Return the current index for `path`, loading it on first use."""
+    path = path or settings.LOCAL_JSON_PATH
+    index = _indexes.get(path)
+    if index is None:
+        with _lock:
+            index = _indexes.get(path)
+            if index is None:
+                index = _indexes[path] = build_index(path)
+    return index
+
+
+def loaded_catalog_index(path: Optional[str] = None) -> Optional[CatalogIndex]:
+    """The current index for `path` if it is already loaded; never builds one."""
+    return _indexes.get(path or settings.LOCAL_JSON_PATH)
+
+
+def set_catalog_index(path: str, index: CatalogIndex):
+    """
+    Make `index` the one later searches of `path` get. A search holds the index it started
+    with, so searches already running finish on the previous one.
+    """
+    global _generation
+    with _lock:
+        _indexes[path] = index
+        _generation += 1
+
+
+def catalog_generation() -> int:
+    """Number of index swaps so far; results tagged with an older one may be stale."""
+    return _generation
+
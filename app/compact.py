@@ -0,0 +1,255 @@
+"""
+Compact, memory-mapped catalog for the local backend.
+
+    python -m app.compact data/bestbuy_seo.json -o data/bestbuy_seo.catalog
+
+Point LOCAL_JSON_PATH at the output directory to use it. Every array is opened read-only with
+mmap, so uvicorn workers share one page-cached copy and startup does no JSON parse.
+
+Layout of the directory: manifest.json, and the version subdirectory it names with every array.
+A rebuild writes a new version subdirectory and then swaps in the manifest naming it, so files a
+worker has mapped are never rewritten; versions older than the previous one are removed.
+    manifest.json            counts, field names, facet values, format version, data subdirectory
+    items_off.npy, items.bin every attribute of every item, item-major, in one offset-indexed blob;
+                             each value is b"s" + UTF-8 for strings, b"j" + JSON otherwise, empty if absent
+    <numeric>.npy            float64 columns for NUMERIC_FIELDS
+    price_order.npy, price_sorted.npy   item ids by ascending price, and those prices
+    facet_<field>_ptr.npy, facet_<field>_ids.npy   sorted item ids per value listed in the manifest
+    vocab.txt / vocab_starts.npy / postings_ptr.npy / postings_ids.npy   the token index
+    embeddings.npy, embedding_scales.npy   int8 item embeddings for LOCAL_SEARCH_MODE=hybrid (with --embeddings)
+"""
+import argparse
+import copy
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .catalog import ATTRIBUTES_TO_RETRIEVE, CatalogIndex, load_catalog
+
+# 2: facets as sorted item ids instead of packed bitsets
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+# Version subdirectories written by write_compact; only these are ever removed
+_VERSION_RE = re.compile(r"^v\d{14}-")
+
+
+def _encode(value: Any) -> bytes:
+    if isinstance(value, str):
+        return b"s" + value.encode("utf-8")
+    return b"j" + json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _decode(raw: bytes) -> Any:
+    if raw[:1] == b"s":
+        return raw[1:].decode("utf-8")
+    return json.loads(raw[1:])
+
+
+def _map(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class CompactItems:
+    """
+    Read-only sequence of catalog items backed by the mmapped blob.
+    Indexing decodes only ATTRIBUTES_TO_RETRIEVE, the fields a search hit carries.
+    """
+
+    def __init__(self, path: str, fields: List[str], count: int):
+        self.fields = fields
+        self.count = count
+        self._offsets = np.load(os.path.join(path, "items_off.npy"), mmap_mode="r")
+        self._blob = _map(os.path.join(path, "items.bin"))
+        retrieve = set(ATTRIBUTES_TO_RETRIEVE)
+        self._retrieve = [j for j, name in enumerate(fields) if name in retrieve]
+        # Items replaced by catalog deltas, by row; the files are never written to
+        self._updates: Dict[int, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        return self.get(i)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.count):
+            yield self.get(i)
+
+    def get(self, i: int, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Attributes of item `i`: ATTRIBUTES_TO_RETRIEVE by default, or the named `fields`."""
+        i = int(i)
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        if i in self._updates:
+            item = self._updates[i]
+            return {name: item[name] for name in (fields or ATTRIBUTES_TO_RETRIEVE) if name in item}
+        width = len(self.fields)
+        # One read for the item's offsets and one for its bytes, then slice locally
+        offsets = self._offsets[i * width:(i + 1) * width + 1].tolist()
+        base = offsets[0]
+        chunk = self._blob[base:offsets[-1]]
+        columns = self._retrieve if fields is None else [j for j, name in enumerate(self.fields) if name in fields]
+        item = {}
+        for j in columns:
+            start, end = offsets[j] - base, offsets[j + 1] - base
+            if end > start:
+                item[self.fields[j]] = _decode(chunk[start:end])
+        return item
+
+    def with_updates(self, updates: Dict[int, Dict[str, Any]]) -> "CompactItems":
+        """View over the same files with the items at the given rows replaced."""
+        items = copy.copy(self)
+        items._updates = {**self._updates, **updates}
+        return items
+
+
+def write_compact(items: List[Dict[str, Any]], path: str, embeddings: bool = False) -> CatalogIndex:
+    """
+    Index `items` and write the compact catalog to the directory `path`, with item embeddings if asked.
+    Workers serving the previous version keep their files: the arrays go to a new subdirectory and
+    the manifest is replaced last.
+    """
+    index = CatalogIndex(items)
+    os.makedirs(path, exist_ok=True)
+    previous = _data_dir_name(path)
+    data = tempfile.mkdtemp(prefix=time.strftime("v%Y%m%d%H%M%S-"), dir=path)
+    os.chmod(data, 0o755)
+
+    fields: List[str] = []
+    seen = set()
+    for item in items:
+        for name in item:
+            if name not in seen:
+                seen.add(name)
+                fields.append(name)
+
+    offsets = np.zeros(len(items) * len(fields) + 1, dtype=np.int64)
+    pos = 0
+    k = 1
+    with open(os.path.join(data, "items.bin"), "wb") as f:
+        for item in items:
+            for name in fields:
+                if name in item:
+                    raw = _encode(item[name])
+                    f.write(raw)
+                    pos += len(raw)
+                offsets[k] = pos
+                k += 1
+    np.save(os.path.join(data, "items_off.npy"), offsets)
+
+    for name, column in index.columns.items():
+        np.save(os.path.join(data, f"{name}.npy"), column)
+    np.save(os.path.join(data, "price_order.npy"), index.price_order)
+    np.save(os.path.join(data, "price_sorted.npy"), index.sorted_prices)
+    for field, (_, ptr, ids) in index.facet_tables.items():
+        np.save(os.path.join(data, f"facet_{field}_ptr.npy"), ptr)
+        np.save(os.path.join(data, f"facet_{field}_ids.npy"), ids)
+    with open(os.path.join(data, "vocab.txt"), "w", encoding="utf-8", newline="") as f:
+        f.write(index._vocab_blob)
+    np.save(os.path.join(data, "vocab_starts.npy"), index._vocab_starts)
+    np.save(os.path.join(data, "postings_ptr.npy"), index._postings_ptr)
+    np.save(os.path.join(data, "postings_ids.npy"), index._postings_ids)
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "count": len(items),
+        "fields": fields,
+        "numeric": list(index.columns),
+        "facets": {field: values for field, (values, _, _) in index.facet_tables.items()},
+        "data": os.path.basename(data),
+    }
+    if embeddings:
+        from .embeddings import EMBEDDING_VERSION
+        np.save(os.path.join(data, "embeddings.npy"), index.dense.vectors)
+        np.save(os.path.join(data, "embedding_scales.npy"), index.dense.scales)
+        manifest["embeddings"] = {"dim": index.dense.dim, "version": EMBEDDING_VERSION}
+    tmp = os.path.join(path, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+    _remove_versions(path, keep={os.path.basename(data), previous})
+    return index
+
+
+def _data_dir_name(path: str) -> Optional[str]:
+    """The version subdirectory the current manifest of `path` names, if any."""
+    try:
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f).get("data")
+    except (OSError, ValueError):
+        return None
+
+
+def _remove_versions(path: str, keep: set):
+    # The previous version stays for workers still loading it; removing older ones is safe even
+    # while mapped, as their pages live until they are unmapped
+    for name in os.listdir(path):
+        if _VERSION_RE.match(name) and name not in keep and os.path.isdir(os.path.join(path, name)):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+
+
+
+def load_compact(path: str) -> CatalogIndex:
+    with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported compact catalog version {manifest.get('version')} in {path}; rebuild it with python -m app.compact"
+        )
+    # Catalogs written before versioned subdirectories keep their arrays next to the manifest
+    data = os.path.join(path, manifest.get("data", ""))
+
+    def array(name: str) -> np.ndarray:
+        return np.load(os.path.join(data, name), mmap_mode="r")
+
+    items = CompactItems(data, manifest["fields"], manifest["count"])
+    columns = {name: array(f"{name}.npy") for name in manifest["numeric"]}
+    facets = {
+        field: (values, array(f"facet_{field}_ptr.npy"), array(f"facet_{field}_ids.npy"))
+        for field, values in manifest["facets"].items()
+    }
+    # str.find needs a str, so the vocabulary (small next to the items) is the one private copy
+    with open(os.path.join(data, "vocab.txt"), "r", encoding="utf-8", newline="") as f:
+        vocab_blob = f.read()
+    index = CatalogIndex.from_arrays(
+        items, columns, facets, vocab_blob,
+        array("vocab_starts.npy"), array("postings_ptr.npy"), array("postings_ids.npy"),
+        price_order=array("price_order.npy"), sorted_prices=array("price_sorted.npy")
+    )
+    stored = manifest.get("embeddings")
+    if stored:
+        from .embeddings import EMBEDDING_VERSION, DenseIndex, item_idf
+    if stored and stored.get("version") == EMBEDDING_VERSION:
+        index._dense = DenseIndex(
+            array("embeddings.npy"), array("embedding_scales.npy"),
+            item_idf(index._postings_ptr, len(index)), index.term_id
+        )
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a compact memory-mapped catalog from a JSON catalog.")
+    parser.add_argument("input", help="JSON catalog (a list of items)")
+    parser.add_argument("-o", "--output", required=True, help="Output directory")
+    parser.add_argument("--embeddings", action="store_true", help="Also store item embeddings for LOCAL_SEARCH_MODE=hybrid")
+    args = parser.parse_args()
+    t = time.perf_counter()
+    items = load_catalog(args.input)
+    index = write_compact(items, args.output, embeddings=args.embeddings)
+    print(f"wrote {len(items)} items, {index.n_terms} terms to {args.output} in {time.perf_counter() - t:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,103 @@ class Settings:
     ALGOLIA_API_KEY: Optional[str] = os.getenv("ALGOLIA_API_KEY")
     ALGOLIA_INDEX_NAME: str = os.getenv("ALGOLIA_INDEX_NAME", "electronics")
     ALGOLIA_TIMEOUT: float = float(os.getenv("ALGOLIA_TIMEOUT", "6.0"))
+    # Base URL override (e.g. a local stand-in for benchmarks); defaults to the app's DSN host
+    ALGOLIA_HOST: Optional[str] = os.getenv("ALGOLIA_HOST")
+    # Hedging: once a call outlives this percentile of recent latencies, the same query also goes to the
+    # next of Algolia's fallback hosts, up to ALGOLIA_MAX_HEDGES extra calls (a percentile of 0 disables it)
+    ALGOLIA_HEDGE_PERCENTILE: float = float(os.getenv("ALGOLIA_HEDGE_PERCENTILE", "0.95"))
+    ALGOLIA_HEDGE_MIN_DELAY: float = float(os.getenv("ALGOLIA_HEDGE_MIN_DELAY", "0.05"))
+    ALGOLIA_MAX_HEDGES: int = int(os.getenv("ALGOLIA_MAX_HEDGES", "2"))
 
     USE_LOCAL_JSON: bool = os.getenv("USE_LOCAL_JSON", "false").lower() in {"1", "true", "yes"}
     LOCAL_JSON_PATH: str = os.getenv("LOCAL_JSON_PATH", "data/bestbuy_seo.json")
+    # "token": count of query tokens found in the item text, "bm25": BM25 over the same fields,
+    # "hybrid": token matches fused with hashed n-gram embeddings (app.embeddings)
+    LOCAL_SEARCH_MODE: str = os.getenv("LOCAL_SEARCH_MODE", "token").lower()
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.5"))
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))
+    # "hybrid": HYBRID_ALPHA * embedding cosine + (1 - HYBRID_ALPHA) * token match share; an item matches on
+    # tokens or on a cosine of at least HYBRID_MIN_SIMILARITY
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "256"))
+    HYBRID_ALPHA: float = float(os.getenv("HYBRID_ALPHA", "0.5"))
+    HYBRID_MIN_SIMILARITY: float = float(os.getenv("HYBRID_MIN_SIMILARITY", "0.3"))
+    # Hot reload: seconds between checks of LOCAL_JSON_PATH and CATALOG_DELTA_DIR (0 disables the watcher)
+    CATALOG_WATCH_INTERVAL: float = float(os.getenv("CATALOG_WATCH_INTERVAL", "0"))
+    CATALOG_DELTA_DIR: Optional[str] = os.getenv("CATALOG_DELTA_DIR")
+    # Required in X-Admin-Key by the /catalog endpoints, which are disabled while it is unset
+    ADMIN_API_KEY: Optional[str] = os.getenv("ADMIN_API_KEY")
+    # Seconds each warm-up connection to Algolia and OpenAI may take before /ready gives up on it
+    WARMUP_TIMEOUT: float = float(os.getenv("WARMUP_TIMEOUT", "5"))
 
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL")
+    OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "30"))
+
+    # "llm": every reply from the model, "template": every reply built from the reranked hits,
+    # "auto": the template when the user stated no preference yet or the top TEMPLATE_MIN_HITS hits
+    # all score at least TEMPLATE_MIN_SCORE, the model otherwise
+    GENERATOR_MODE: str = os.getenv("GENERATOR_MODE", "llm").lower()
+    TEMPLATE_MIN_HITS: int = int(os.getenv("TEMPLATE_MIN_HITS", "3"))
+    TEMPLATE_MIN_SCORE: float = float(os.getenv("TEMPLATE_MIN_SCORE", "0.8"))
+
+    # Seconds a request may take end to end (RecommendRequest.deadline_ms overrides it; 0 disables).
+    # Upstream calls get what is left: Algolia gives way to the local catalog below ALGOLIA_MIN_BUDGET,
+    # the LLM to a template reply built from the reranked hits below LLM_MIN_BUDGET
+    REQUEST_DEADLINE: float = float(os.getenv("REQUEST_DEADLINE", "15"))
+    ALGOLIA_MIN_BUDGET: float = float(os.getenv("ALGOLIA_MIN_BUDGET", "0.3"))
+    LLM_MIN_BUDGET: float = float(os.getenv("LLM_MIN_BUDGET", "1.5"))
+    # Serve retrieval from LOCAL_JSON_PATH, when it exists, if Algolia fails or is out of time
+    RETRIEVAL_FALLBACK_LOCAL: bool = os.getenv("RETRIEVAL_FALLBACK_LOCAL", "true").lower() in {"1", "true", "yes"}
+
+    # Admission control per upstream: at most *_MAX_CONCURRENCY calls in flight, started at no more than
+    # *_RATE_LIMIT per second (bursts of *_RATE_BURST; 0 is unlimited). The rest wait in a queue of up to
+    # ADMISSION_QUEUE_SIZE, interactive requests ahead of batch items, and are shed when the queue is full
+    # or their wait would outlast the deadline: Algolia gives way to the local catalog and the LLM to a
+    # template reply, or the request fails fast with 429/503 and Retry-After
+    ALGOLIA_MAX_CONCURRENCY: int = int(os.getenv("ALGOLIA_MAX_CONCURRENCY", "32"))
+    ALGOLIA_RATE_LIMIT: float = float(os.getenv("ALGOLIA_RATE_LIMIT", "0"))
+    ALGOLIA_RATE_BURST: float = float(os.getenv("ALGOLIA_RATE_BURST", "20"))
+    OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+    OPENAI_RATE_LIMIT: float = float(os.getenv("OPENAI_RATE_LIMIT", "0"))
+    OPENAI_RATE_BURST: float = float(os.getenv("OPENAI_RATE_BURST", "5"))
+    ADMISSION_QUEUE_SIZE: int = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))
+
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+    LLM_CACHE_TTL: float = float(os.getenv("LLM_CACHE_TTL", "3600"))
+    LLM_CACHE_SIZE: int = int(os.getenv("LLM_CACHE_SIZE", "512"))
+    # Optional SQLite file for a persistent tier behind the in-memory one
+    LLM_CACHE_PATH: Optional[str] = os.getenv("LLM_CACHE_PATH")
+
+    RETRIEVAL_CACHE_ENABLED: bool = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+    RETRIEVAL_CACHE_TTL: float = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+    RETRIEVAL_CACHE_SIZE: int = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+
+    # How long a request waits on an identical in-flight Algolia/OpenAI call it joined
+    RETRIEVAL_FLIGHT_TIMEOUT: float = float(os.getenv("RETRIEVAL_FLIGHT_TIMEOUT", "20"))
+    LLM_FLIGHT_TIMEOUT: float = float(os.getenv("LLM_FLIGHT_TIMEOUT", "60"))
+
+    # JSON keyword tables for slot extraction; the bundled app/data/intent_keywords.json when unset
+    INTENT_KEYWORDS_PATH: Optional[str] = os.getenv("INTENT_KEYWORDS_PATH")
+
+    # Prompt packing: token budget for the user prompt and how much history/hits it may carry
+    PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+    PROMPT_MAX_HITS: int = int(os.getenv("PROMPT_MAX_HITS", "10"))
+    PROMPT_MIN_HITS: int = int(os.getenv("PROMPT_MIN_HITS", "3"))
+    PROMPT_HISTORY_MESSAGES: int = int(os.getenv("PROMPT_HISTORY_MESSAGES", "5"))
+    TOKENIZER_ENCODING: str = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+    # Conversation sessions (requests with a conversation_id); the history window plus the summary
+    # line and the new message fit the default PROMPT_HISTORY_MESSAGES
+    SESSION_MAX: int = int(os.getenv("SESSION_MAX", "10000"))
+    SESSION_TTL: float = float(os.getenv("SESSION_TTL", "1800"))
+    SESSION_HISTORY_MESSAGES: int = int(os.getenv("SESSION_HISTORY_MESSAGES", "3"))
+    SESSION_SUMMARY_REQUESTS: int = int(os.getenv("SESSION_SUMMARY_REQUESTS", "5"))
+    SESSION_SUMMARY_CHARS: int = int(os.getenv("SESSION_SUMMARY_CHARS", "200"))
+    # SQLite file shared by the workers on one host, so any worker can serve any turn; in memory when unset
+    SESSION_STORE_PATH: Optional[str] = os.getenv("SESSION_STORE_PATH")
+
+    # Most requests one POST /recommend/batch may carry
+    BATCH_MAX_REQUESTS: int = int(os.getenv("BATCH_MAX_REQUESTS", "1000"))
 
     MAX_HITS: int = int(os.getenv("MAX_HITS", "24"))
     HITS_PER_PAGE: int = int(os.getenv("HITS_PER_PAGE", "24"))
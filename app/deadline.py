@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, List, Optional
+
+# Per-request deadline (time.monotonic()), set by the endpoint and read by the upstream calls
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def start_deadline(seconds: Optional[float]):
+    _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def time_left(cap: float, floor: float = 0.0) -> float:
+    """`cap` shortened to what is left of the deadline, but not below `floor`."""
+    left = remaining()
+    return cap if left is None else min(cap, max(floor, left))
+
+
+def has_budget(needed: float) -> bool:
+    left = remaining()
+    return left is None or left >= needed
+
+
+class LatencyTracker:
+    """Latencies of an upstream's recent successful calls."""
+
+    def __init__(self, window: int = 512, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The `q` quantile of the window, or None until it holds `min_samples` calls."""
+        if len(self._samples) < self.min_samples:
+            return None
+        values = sorted(self._samples)
+        return values[int(q * (len(values) - 1))]
+
+
+async def hedged(
+    attempts: List[Callable[[], Awaitable[Any]]],
+    delay: Optional[float],
+    on_hedge: Optional[Callable[[], None]] = None,
+    admit: Optional[Callable[[], Optional[Callable[[], None]]]] = None
+) -> Any:
+    """
+    Run attempts[0]; start the next attempt whenever `delay` seconds pass without an answer
+    (None: never) or an attempt fails. The first success wins and the others are cancelled;
+    when every attempt fails, the last error is raised.
+
+    `admit`, when given, is asked before each attempt after the first: it returns the function
+    that frees what the attempt holds once it is done, or None to skip that attempt.
+    """
+    pending = set()
+    started = 0
+    error: Optional[BaseException] = None
+
+    def launch() -> bool:
+        nonlocal started
+        index, started = started, started + 1
+        release = None
+        if index and admit is not None:
+            release = admit()
+            if release is None:
+                return False
+        task = asyncio.ensure_future(attempts[index]())
+        if release is not None:
+            # Runs even if the task is cancelled before it starts
+            task.add_done_callback(lambda _: release())
+        pending.add(task)
+        return True
+
+    launch()
+    try:
+        while pending:
+            more = started < len(attempts)
+            done, _ = await asyncio.wait(pending, timeout=delay if more else None, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if launch() and on_hedge is not None:
+                    on_hedge()
+                continue
+            for task in done:
+                pending.discard(task)
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            # Fail over at once rather than waiting out the hedge delay
+            if started < len(attempts):
+                launch()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,154 @@
+"""
+Hashed n-gram embeddings for hybrid local search: CPU only, no model, no network.
+
+A term's vector is the sum of its character 3-5-grams (the term wrapped in "<" and ">", so the
+whole word is a feature too), each hashed with CRC-32 into a signed bucket and L2-normalized.
+Terms sharing most of their n-grams ("video"/"videos", "edit"/"editing", small typos) land close.
+An item's vector is the IDF-weighted sum of the vectors of its terms, taken from the token index's
+postings, so items are never re-tokenized. Item vectors are L2-normalized and stored as int8 with
+one float32 scale per row (dim bytes + 4 per item); scoring is a chunked matrix product.
+"""
+import logging
+import re
+import zlib
+from array import array
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# Bump when the features change: stored embeddings from another version are rebuilt, not reused
+EMBEDDING_VERSION = 1
+NGRAMS = (3, 4, 5)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Rows embedded per sparse product when building; the sparse result takes about twice its dense size
+CHUNK_ROWS = 16384
+# Rows dequantized per scoring product: small enough for the float32 copy to stay in cache
+SCORE_CHUNK_ROWS = 2048
+
+
+def term_features(term: str, dim: int) -> List[tuple]:
+    """(bucket, sign) for every hashed n-gram of `term`'s alphanumeric pieces."""
+    features = []
+    for piece in _WORD_RE.findall(term.lower()):
+        padded = f"<{piece}>".encode("utf-8")
+        grams = {padded[i:i + n] for n in NGRAMS for i in range(len(padded) - n + 1)}
+        # Pieces shorter than the smallest n-gram are a single feature
+        for gram in grams or (padded,):
+            h = zlib.crc32(gram)
+            features.append((h % dim, 1.0 if h & 0x80000000 else -1.0))
+    return features
+
+
+def term_matrix(terms: List[str], dim: int, weights: Optional[np.ndarray] = None) -> sparse.csr_matrix:
+    """
+    Unit vectors for `terms` as sparse rows, each scaled by its entry of `weights` when given
+    (empty rows for terms without alphanumerics).
+    """
+    # Typed arrays: a list of Python numbers per n-gram of a large vocabulary outweighs the matrix
+    rows, cols, signs = array("i"), array("i"), array("f")
+    for j, term in enumerate(terms):
+        for bucket, sign in term_features(term, dim):
+            rows.append(j)
+            cols.append(bucket)
+            signs.append(sign)
+    vectors = sparse.csr_matrix(
+        (np.frombuffer(signs, dtype=np.float32), (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32))),
+        shape=(len(terms), dim)
+    )
+    norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+    scale = 1.0 / np.where(norms > 0, norms, 1.0)
+    if weights is not None:
+        scale = scale * weights
+    return (sparse.diags(scale.astype(np.float32)) @ vectors).tocsr()
+
+
+def quantize(vectors: np.ndarray) -> tuple:
+    """Symmetric per-row int8 quantization: (int8 rows, float32 scale per row)."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class DenseIndex:
+    """Quantized item embeddings plus what is needed to embed queries the same way."""
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        scales: np.ndarray,
+        idf: np.ndarray,
+        term_id: Callable[[str], Optional[int]]
+    ):
+        self.vectors = vectors
+        self.scales = scales
+        self.dim = vectors.shape[1]
+        self.idf = idf
+        self.term_id = term_id
+        # IDF of a query term the catalog doesn't contain: rarer than any it does
+        self.unknown_idf = float(np.log1p(len(vectors)))
+        self.term_vector = lru_cache(maxsize=65536)(self._term_vector)
+
+    @classmethod
+    def build(
+        cls,
+        vocab: List[str],
+        postings_ptr: np.ndarray,
+        postings_ids: np.ndarray,
+        n_items: int,
+        dim: int,
+        term_id: Callable[[str], Optional[int]]
+    ) -> "DenseIndex":
+        idf = item_idf(postings_ptr, n_items)
+        weights = term_matrix(vocab, dim, idf)
+        # Item x term incidence, from the term x item postings
+        incidence = sparse.csc_matrix(
+            (np.ones(len(postings_ids), dtype=np.float32), postings_ids, postings_ptr),
+            shape=(n_items, len(vocab))
+        ).tocsr()
+        vectors = np.empty((n_items, dim), dtype=np.int8)
+        scales = np.empty(n_items, dtype=np.float32)
+        for lo in range(0, n_items, CHUNK_ROWS):
+            # Sparse product; only this chunk's item vectors are ever dense
+            block = (incidence[lo:lo + CHUNK_ROWS] @ weights).toarray()
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            vectors[lo:lo + len(block)], scales[lo:lo + len(block)] = quantize(block / np.where(norms > 0, norms, 1.0))
+        logger.info(f"Dense index built: {n_items} items x {dim} dims from {len(vocab)} terms")
+        return cls(vectors, scales, idf, term_id)
+
+    def _term_vector(self, term: str) -> np.ndarray:
+        return term_matrix([term], self.dim).toarray()[0]
+
+    def embed(self, queries: List[str]) -> np.ndarray:
+        """Unit query vectors, one row per query, weighted like the items' terms."""
+        out = np.zeros((len(queries), self.dim), dtype=np.float32)
+        for i, query in enumerate(queries):
+            for term in query.lower().split():
+                j = self.term_id(term)
+                out[i] += self.term_vector(term) * (self.unknown_idf if j is None else self.idf[j])
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms > 0, norms, 1.0)
+
+    def scores(self, query_vectors: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of every item (rows of the result) with every query vector (columns),
+        or of the items `rows` only, in that order.
+        """
+        vectors, scales = self.vectors, self.scales
+        if rows is not None:
+            vectors, scales = vectors[rows], scales[rows]
+        out = np.empty((len(vectors), len(query_vectors)), dtype=np.float32)
+        q = np.ascontiguousarray(query_vectors.T, dtype=np.float32)
+        for lo in range(0, len(vectors), SCORE_CHUNK_ROWS):
+            block = vectors[lo:lo + SCORE_CHUNK_ROWS]
+            out[lo:lo + len(block)] = (block.astype(np.float32) @ q) * scales[lo:lo + len(block), None]
+        return out
+
+
+def item_idf(postings_ptr: np.ndarray, n_items: int) -> np.ndarray:
+    df = np.diff(np.asarray(postings_ptr)).astype(np.float32)
+    return np.log1p(n_items / np.maximum(df, 1.0)).astype(np.float32)
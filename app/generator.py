@@ -1,100 +1,169 @@
+import asyncio
 import json
 import logging
-from typing import List, Dict, Any, Tuple
-from openai import OpenAI
-from openai import OpenAIError
+import time
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple, Optional
 
 from .config import settings
+from .admission import Overloaded, Scheduler
+from .singleflight import SingleFlight
+from .metrics import fallbacks, register_cache, register_flight, template_replies, timed
+from .cache import Cache, MemoryBackend, DiskBackend, TieredBackend, make_key
+from .deadline import has_budget, time_left
+from .prompt import build_prompt
+from .template import template_reason, template_response
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+# The OpenAI SDK is the slowest import in the app: it and its clients load on first use (or at warm-up)
+_client = None
+_async_client = None
 
+MODEL = "gpt-4o-mini"
+SYSTEM_MESSAGE = "You are a device recommendation expert."
+TEMPERATURE = 0.7
+MAX_TOKENS = 1000
 
-def generate(user_text: str, slots: Dict[str, Any], top_hits: List[Dict[str, Any]], messages: List[Dict[str, str]] = None) -> Tuple[Dict[str, Any], bool, str]:
-    """
-    Use OpenAI LLM to generate conversational response based on query, slots, and retrieved hits.
-    Custom prompt logic for RAG, education, and clarifying questions.
-    Returns: gen_out dict, used_fallback (False if LLM succeeds), conversational_response str
-    """
+
+def _llm_cache_backend():
+    memory = MemoryBackend(settings.LLM_CACHE_SIZE)
+    if settings.LLM_CACHE_PATH:
+        return TieredBackend(memory, DiskBackend(settings.LLM_CACHE_PATH), promote_ttl=settings.LLM_CACHE_TTL)
+    return memory
+
+
+# Raw completions keyed on everything that is sent to the model
+llm_cache = Cache("llm", backend=_llm_cache_backend(), ttl=settings.LLM_CACHE_TTL, enabled=settings.LLM_CACHE_ENABLED)
+
+
+generation_flight = SingleFlight("llm", timeout=settings.LLM_FLIGHT_TIMEOUT)
+register_cache(llm_cache)
+register_flight(generation_flight)
+
+openai_scheduler = Scheduler(
+    "openai",
+    settings.OPENAI_MAX_CONCURRENCY,
+    rate=settings.OPENAI_RATE_LIMIT,
+    burst=settings.OPENAI_RATE_BURST,
+    max_queue=settings.ADMISSION_QUEUE_SIZE,
+    min_budget=settings.LLM_MIN_BUDGET
+)
+
+
+def prompt_fingerprint(prompt: str) -> str:
+    return make_key(MODEL, SYSTEM_MESSAGE, prompt, TEMPERATURE, MAX_TOKENS)
+
+
+def get_client() -> "OpenAI":
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL, timeout=settings.OPENAI_TIMEOUT)
+    return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    global _async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI
+        _async_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL, timeout=settings.OPENAI_TIMEOUT)
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+async def open_connection(timeout: float):
+    """One cheap call (the model list) so the client's pool holds a connection before the first request."""
+    from openai import APIStatusError
+    try:
+        await get_async_client().with_options(max_retries=0, timeout=timeout).models.list()
+    except APIStatusError as e:
+        # Any answer means the connection is open
+        logger.info(f"OpenAI connection open (model list: {e.status_code})")
+
+
+def _check_api_key():
     if not settings.OPENAI_API_KEY:
         logger.error("OPENAI_API_KEY not set in environment.")
         raise ValueError("OPENAI_API_KEY not set in environment.")
 
-    # Trim conversation history to avoid token limit (e.g., keep last 5 messages)
-    conversation_history = ""
-    if messages:
-        messages = messages[-5:]  # Limit to last 5 messages to avoid token overflow
-        conversation_history = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-        logger.info(f"Conversation history trimmed to {len(messages)} messages")
-
-    # Simplify hits for prompt (avoid overwhelming token limit)
-    simplified_hits = []
-    for hit in top_hits[:10]:
-        simplified_hits.append({
-            "title": hit.get("title") or hit.get("name") or "Unknown Product",
-            "price": hit.get("price"),
-            "url": hit.get("url"),
-            "brand": hit.get("brand"),
-            "os": hit.get("os"),
-            "ram": hit.get("ram"),
-            "camera": hit.get("camera"),
-            "description": hit.get("shortDescription") or hit.get("description") or "",
-            "score": hit.get("_advisorScore", 0.0)
-        })
-
-    prompt = f"""
-You are a helpful AI advisor recommending electronic devices based on user needs.
-User query: {user_text}
-Extracted slots: {json.dumps(slots, indent=2)}
-Conversation history (if any): {conversation_history}
-
-Available products from search (top relevant hits):
-{json.dumps(simplified_hits, indent=2)}
-
-Instructions:
-- If the user asks for an explanation (e.g., 'what is RAM?'), explain the term simply in 1-2 sentences, then relate it to device recommendations (e.g., suggest minimum specs like 8GB RAM for daily use).
-- Recommend 3-5 top products that best match the slots and query. For each:
-  - Provide title, price, url.
-  - List 2-3 reasons why it matches, citing specific attributes (e.g., 'High RAM: 16GB' or 'Great camera: 48MP with OIS').
-- Be conversational, engaging, and adapt to the conversation history (e.g., refine based on prior user inputs).
-- If information is missing (e.g., no OS preference), ask 1-3 relevant clarifying questions (e.g., 'Do you prefer Windows or macOS?').
-- If no good matches, suggest alternatives or ask for more details.
-- Output in JSON: {{"recommendations": [{{"title": str, "price": float, "url": str, "reasons": [str], "citations": [str]}}], "clarifying_questions": [str]}}
-- Follow with a conversational response (after a separator '---') incorporating the recommendations and questions in natural language.
-- Do not use hardcoded responses; base everything on the provided data.
-"""
-
-    if len(prompt) > 12000:
-        logger.warning("Prompt too long, truncating hits")
-        simplified_hits = simplified_hits[:5]
-        prompt = prompt.replace(json.dumps(simplified_hits, indent=2), json.dumps(simplified_hits[:5], indent=2))
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a device recommendation expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1000
-        )
-        llm_output = response.choices[0].message.content.strip()
-        logger.info("LLM response received successfully")
+def _chat_messages(prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _cached_output(key: str, bypass_cache: bool) -> Optional[str]:
+    if bypass_cache:
+        return None
+    llm_output = llm_cache.get(key)
+    if llm_output is not None:
+        logger.info("LLM response served from cache")
+    return llm_output
+
+
+def _parse_and_store(key: str, llm_output: str, user_text: str, bypass_cache: bool, cached: bool) -> Tuple[Dict[str, Any], bool, str]:
+    with timed("parse"):
+        result = parse_output(llm_output, user_text)
+    # Only completions that parsed are worth replaying
+    if not (bypass_cache or cached or result[1]):
+        llm_cache.set(key, llm_output)
+    return result
+
+
+def _api_error_result(e: Exception) -> Tuple[Dict[str, Any], bool, str]:
+    logger.error(f"OpenAI API error: {str(e)}")
+    gen_out = {
+        "recommendations": [],
+        "clarifying_questions": ["Could you clarify your requirements or try again later?"]
+    }
+    conversational_response = f"Sorry, I ran into an issue connecting to the recommendation engine. Could you clarify your requirements, like {' or '.join(gen_out['clarifying_questions'])}"
+    return gen_out, True, conversational_response
+
+
+def _failure_result(e: Exception, user_text: str, slots: Dict[str, Any], top_hits: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], bool, str]:
+    """
+    The reply for a failed LLM call: the template for connection errors, timeouts and shed calls,
+    the error reply for other OpenAI errors. Anything else is re-raised.
+    """
+    from openai import APIConnectionError, OpenAIError
+    if isinstance(e, (APIConnectionError, asyncio.TimeoutError, Overloaded)):
+        return _template_result(user_text, slots, top_hits, f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+    if isinstance(e, OpenAIError):
+        return _api_error_result(e)
+    raise e
+
+
+def _template_result(user_text: str, slots: Dict[str, Any], top_hits: List[Dict[str, Any]], reason: str) -> Tuple[Dict[str, Any], bool, str]:
+    logger.warning(f"Answering from the reranked hits without the LLM ({reason})")
+    fallbacks.inc(kind="template")
+    return template_response(user_text, slots, top_hits)
 
-    except OpenAIError as e:
-        logger.error(f"OpenAI API error: {str(e)}")
-        gen_out = {
-            "recommendations": [],
-            "clarifying_questions": ["Could you clarify your requirements or try again later?"]
-        }
-        conversational_response = f"Sorry, I ran into an issue connecting to the recommendation engine. Could you clarify your requirements, like {' or '.join(gen_out['clarifying_questions'])}"
-        return gen_out, True, conversational_response
 
-    # Parse LLM output
+def _policy_template(user_text: str, slots: Dict[str, Any], top_hits: List[Dict[str, Any]]) -> Optional[Tuple[Dict[str, Any], bool, str]]:
+    """The template reply when GENERATOR_MODE picks it over the LLM for this request."""
+    reason = template_reason(slots, top_hits)
+    if reason is None:
+        return None
+    template_replies.inc(reason=reason)
+    with timed("template"):
+        return template_response(user_text, slots, top_hits, fallback=False)
+
+
+def parse_output(llm_output: str, user_text: str) -> Tuple[Dict[str, Any], bool, str]:
+    """Split the LLM output into the JSON block and the conversational text after '---'."""
     try:
         if "```json" in llm_output and "```" in llm_output:
             json_part = llm_output.split("```json")[1].split("```")[0].strip()
@@ -129,3 +198,213 @@ Instructions:
         }
         conversational_response = f"Sorry, I couldn't process the recommendations properly for '{user_text}'. Could you provide more details, like {' or '.join(gen_out['clarifying_questions'])}"
         return gen_out, True, conversational_response
+
+
+def generate(user_text: str, slots: Dict[str, Any], top_hits: List[Dict[str, Any]], messages: List[Dict[str, str]] = None, bypass_cache: bool = False) -> Tuple[Dict[str, Any], bool, str]:
+    """
+    Use OpenAI LLM to generate conversational response based on query, slots, and retrieved hits.
+    Custom prompt logic for RAG, education, and clarifying questions.
+    Returns: gen_out dict, used_fallback (False if LLM succeeds), conversational_response str
+    """
+    result = _policy_template(user_text, slots, top_hits)
+    if result is not None:
+        return result
+    _check_api_key()
+    with timed("prompt_build"):
+        prompt = build_prompt(user_text, slots, top_hits, messages)
+    key = prompt_fingerprint(prompt)
+    llm_output = _cached_output(key, bypass_cache)
+    if llm_output is not None:
+        return _parse_and_store(key, llm_output, user_text, bypass_cache, cached=True)
+    if not has_budget(settings.LLM_MIN_BUDGET):
+        return _template_result(user_text, slots, top_hits, "no time left for the LLM")
+
+    try:
+        with timed("llm_call"):
+            response = get_client().chat.completions.create(
+                model=MODEL,
+                messages=_chat_messages(prompt),
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+                timeout=time_left(settings.OPENAI_TIMEOUT)
+            )
+        llm_output = response.choices[0].message.content.strip()
+        logger.info("LLM response received successfully")
+
+    except Exception as e:
+        return _failure_result(e, user_text, slots, top_hits)
+
+    return _parse_and_store(key, llm_output, user_text, bypass_cache, cached=False)
+
+
+async def _acomplete(prompt: str) -> str:
+    async with openai_scheduler.slot():
+        response = await get_async_client().chat.completions.create(
+            model=MODEL,
+            messages=_chat_messages(prompt),
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS
+        )
+    llm_output = response.choices[0].message.content.strip()
+    logger.info("LLM response received successfully")
+    return llm_output
+
+
+async def agenerate(user_text: str, slots: Dict[str, Any], top_hits: List[Dict[str, Any]], messages: List[Dict[str, str]] = None, bypass_cache: bool = False) -> Tuple[Dict[str, Any], bool, str]:
+    """Async `generate`: awaits the completion on the shared AsyncOpenAI client instead of blocking a worker."""
+    result = _policy_template(user_text, slots, top_hits)
+    if result is not None:
+        return result
+    _check_api_key()
+    with timed("prompt_build"):
+        prompt = build_prompt(user_text, slots, top_hits, messages)
+    key = prompt_fingerprint(prompt)
+    llm_output = _cached_output(key, bypass_cache)
+    if llm_output is not None:
+        return _parse_and_store(key, llm_output, user_text, bypass_cache, cached=True)
+    if not has_budget(settings.LLM_MIN_BUDGET):
+        return _template_result(user_text, slots, top_hits, "no time left for the LLM")
+
+    try:
+        with timed("llm_call"):
+            if bypass_cache:
+                llm_output = await asyncio.wait_for(_acomplete(prompt), time_left(settings.OPENAI_TIMEOUT))
+            else:
+                # Concurrent requests with the same prompt share one completion
+                llm_output = await generation_flight.do(key, lambda: _acomplete(prompt), timeout=time_left(settings.LLM_FLIGHT_TIMEOUT))
+
+    except Exception as e:
+        return _failure_result(e, user_text, slots, top_hits)
+
+    return _parse_and_store(key, llm_output, user_text, bypass_cache, cached=False)
+
+
+class ConversationalTextStream:
+    """
+    Incrementally picks the conversational text out of a streamed completion.
+    Mirrors `parse_output`: text only counts once a ```json block has closed, starts after the
+    first '---' and ends at the next one. A short tail is held back so a separator split across
+    chunks is never emitted as text.
+    """
+
+    SEPARATOR = "---"
+
+    def __init__(self):
+        self.buffer = ""
+        self._start = None  # offset of the conversational text in buffer
+        self._emitted = 0
+        self._done = False
+        self._text_started = False
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        if self._done:
+            return ""
+        if self._start is None:
+            block = self.buffer.find("```json")
+            if block == -1:
+                return ""
+            closing = self.buffer.find("```", block + len("```json"))
+            if closing == -1:
+                return ""
+            sep = self.buffer.find(self.SEPARATOR)
+            if sep == -1:
+                return ""
+            self._start = self._emitted = sep + len(self.SEPARATOR)
+
+        end = self.buffer.find(self.SEPARATOR, self._start)
+        if end != -1:
+            self._done = True
+            limit = end
+        else:
+            limit = len(self.buffer) - (len(self.SEPARATOR) - 1)
+        if limit <= self._emitted:
+            return ""
+        return self._take(limit)
+
+    def flush(self) -> str:
+        if self._start is None or self._done:
+            return ""
+        return self._take(len(self.buffer)).rstrip()
+
+    def _take(self, limit: int) -> str:
+        out = self.buffer[self._emitted:limit]
+        self._emitted = limit
+        if not self._text_started:
+            # parse_output strips the text, so drop the whitespace right after the separator
+            out = out.lstrip()
+            self._text_started = bool(out)
+        return out
+
+
+async def agenerate_stream(user_text: str, slots: Dict[str, Any], top_hits: List[Dict[str, Any]], messages: List[Dict[str, str]] = None, bypass_cache: bool = False):
+    """
+    Streaming `agenerate`. Yields ("token", text) for the conversational part as it arrives,
+    then one ("final", (gen_out, used_fallback, conversational_response)) parsed from the full output.
+    """
+    result = _policy_template(user_text, slots, top_hits)
+    if result is not None:
+        yield "token", result[2]
+        yield "final", result
+        return
+    _check_api_key()
+    with timed("prompt_build"):
+        prompt = build_prompt(user_text, slots, top_hits, messages)
+    key = prompt_fingerprint(prompt)
+    text_stream = ConversationalTextStream()
+
+    llm_output = _cached_output(key, bypass_cache)
+    if llm_output is not None:
+        # Replay the cached completion through the same splitter so clients see the same events
+        text = text_stream.feed(llm_output) + text_stream.flush()
+        if text:
+            yield "token", text
+        yield "final", _parse_and_store(key, llm_output, user_text, bypass_cache, cached=True)
+        return
+    if not has_budget(settings.LLM_MIN_BUDGET):
+        result = _template_result(user_text, slots, top_hits, "no time left for the LLM")
+        yield "token", result[2]
+        yield "final", result
+        return
+
+    try:
+        with timed("llm_call"):
+            end = time.monotonic() + time_left(settings.OPENAI_TIMEOUT)
+            async with openai_scheduler.slot():
+                stream = await asyncio.wait_for(
+                    get_async_client().chat.completions.create(
+                        model=MODEL,
+                        messages=_chat_messages(prompt),
+                        temperature=TEMPERATURE,
+                        max_tokens=MAX_TOKENS,
+                        stream=True
+                    ),
+                    end - time.monotonic()
+                )
+                chunks = stream.__aiter__()
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, end - time.monotonic()))
+                        except StopAsyncIteration:
+                            break
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            text = text_stream.feed(delta)
+                            if text:
+                                yield "token", text
+                finally:
+                    await stream.close()
+        tail = text_stream.flush()
+        if tail:
+            yield "token", tail
+        logger.info("LLM stream completed successfully")
+
+    except Exception as e:
+        # Text already streamed is superseded by the template in the final event
+        yield "final", _failure_result(e, user_text, slots, top_hits)
+        return
+
+    yield "final", _parse_and_store(key, text_stream.buffer.strip(), user_text, bypass_cache, cached=False)
@@ -1,5 +1,87 @@
+import json
+import os
 import re
-from typing import Dict, Union, List
+from functools import lru_cache
+from typing import Any, Dict, Union, List, Optional
+
+from .config import settings
+
+DEFAULT_KEYWORDS_PATH = os.path.join(os.path.dirname(__file__), "data", "intent_keywords.json")
+
+_EDUCATION_RES = [re.compile(r"what is ([a-zA-Z\s]+)\??"), re.compile(r"explain ([a-zA-Z\s]+)\??")]
+_RAM_RE = re.compile(r"(\d+)\s*gb\s*ram")
+_UNDER_RE = re.compile(r"under\s*\$?\s*(\d+)")
+_BETWEEN_RE = re.compile(r"between\s*\$?\s*(\d+)\s*and\s*\$?\s*(\d+)")
+
+
+class SlotExtractor:
+    """
+    Rule-based slot extraction driven by keyword tables.
+    Each slot's table is an ordered list of (value, keywords); the first entry with a keyword in the
+    text wins. Checks short-circuit in table order, like the hand-written chain they replace.
+    """
+
+    def __init__(self, tables: Dict[str, List[Dict[str, Any]]]):
+        self.tables = [
+            (slot, [(entry["value"], tuple(k.lower() for k in entry["keywords"])) for entry in entries])
+            for slot, entries in tables.items()
+        ]
+
+    @classmethod
+    def from_file(cls, path: str) -> "SlotExtractor":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _lookup(self, t: str) -> Dict[str, Any]:
+        slots: Dict[str, Any] = {}
+        for slot, entries in self.tables:
+            slots[slot] = next((value for value, kws in entries for k in kws if k in t), None)
+        return slots
+
+    def extract(self, text: str) -> Dict[str, Union[str, float, None]]:
+        t = text.lower()
+        slots = self._lookup(t)
+
+        education_query = None
+        for pattern in _EDUCATION_RES:
+            m = pattern.search(t)
+            if m:
+                education_query = m.group(1).strip()
+                break
+
+        m = _RAM_RE.search(t)
+        ram = int(m.group(1)) if m else None
+
+        budget_min = None
+        budget_max = None
+        m = _UNDER_RE.search(t)
+        if m:
+            budget_max = float(m.group(1))
+        m = _BETWEEN_RE.search(t)
+        if m:
+            budget_min = float(m.group(1))
+            budget_max = float(m.group(2))
+
+        return {
+            "use_case": slots.get("use_case"),
+            "os": slots.get("os"),
+            "weight": slots.get("weight"),
+            "camera": slots.get("camera"),
+            "ram": ram,
+            "budget_min": budget_min,
+            "budget_max": budget_max,
+            "device_type": slots.get("device_type"),
+            "education_query": education_query
+        }
+
+    def extract_batch(self, texts: List[str]) -> List[Dict[str, Union[str, float, None]]]:
+        return [self.extract(text) for text in texts]
+
+
+@lru_cache(maxsize=None)
+def get_extractor(path: Optional[str] = None) -> SlotExtractor:
+    """Extractor for the keyword tables at `path` (INTENT_KEYWORDS_PATH or the bundled tables)."""
+    return SlotExtractor.from_file(path or settings.INTENT_KEYWORDS_PATH or DEFAULT_KEYWORDS_PATH)
 
 
 def extract_slots(text: str) -> Dict[str, Union[str, float, None]]:
@@ -7,86 +89,11 @@ def extract_slots(text: str) -> Dict[str, Union[str, float, None]]:
     Lightweight rule-based intent/slot extraction.
     Returns dict fields that help build Algolia filters & boosts, plus educational query detection.
     """
-    t = text.lower()
-
-    education_query = None
-    education_patterns = [
-        r"what is ([a-zA-Z\s]+)\??",
-        r"explain ([a-zA-Z\s]+)\??",
-    ]
-    for pattern in education_patterns:
-        m = re.search(pattern, t)
-        if m:
-            education_query = m.group(1).strip()  
-            break
-
-    use_case = None
-    if any(k in t for k in ["programming", "developer", "coding", "software dev"]):
-        use_case = "programming"
-    elif any(k in t for k in ["gaming", "gamer"]):
-        use_case = "gaming"
-    elif any(k in t for k in ["daily use", "everyday", "browsing", "office", "word", "excel"]):
-        use_case = "everyday"
-    elif "social media" in t or "tiktok" in t or "instagram" in t:
-        use_case = "social_media"
-
-    os_pref = None
-    if "windows" in t:
-        os_pref = "Windows"
-    elif "mac" in t or "macos" in t or "macbook" in t or "ios" in t:
-        os_pref = "Apple"
-    elif "android" in t:
-        os_pref = "Android"
-    elif "chrome" in t or "chromebook" in t:
-        os_pref = "ChromeOS"
-
-    weight_pref = None
-    if "lightweight" in t or "portable" in t or "thin" in t:
-        weight_pref = "light"
-
-    camera_pref = None
-    if "camera" in t:
-        camera_pref = "great_camera"
-    if "video" in t:
-        camera_pref = "video"
-
-    ram = None
-    m = re.search(r'(\d+)\s*gb\s*ram', t)
-    if m:
-        try:
-            ram = int(m.group(1))
-        except:
-            pass
-
-    budget_min = None
-    budget_max = None
-    m = re.search(r'under\s*\$?\s*(\d+)', t)
-    if m:
-        budget_max = float(m.group(1))
-    m = re.search(r'between\s*\$?\s*(\d+)\s*and\s*\$?\s*(\d+)', t)
-    if m:
-        budget_min = float(m.group(1))
-        budget_max = float(m.group(2))
-
-    device_type = None
-    if any(x in t for x in ["laptop", "notebook", "ultrabook", "macbook"]):
-        device_type = "laptop"
-    elif any(x in t for x in ["phone", "smartphone", "iphone", "android"]):
-        device_type = "phone"
-    elif any(x in t for x in ["tablet", "ipad", "galaxy tab"]):
-        device_type = "tablet"
-
-    return {
-        "use_case": use_case,
-        "os": os_pref,
-        "weight": weight_pref,
-        "camera": camera_pref,
-        "ram": ram,
-        "budget_min": budget_min,
-        "budget_max": budget_max,
-        "device_type": device_type,
-        "education_query": education_query
-    }
+    return get_extractor().extract(text)
+
+
+def extract_slots_batch(texts: List[str]) -> List[Dict[str, Union[str, float, None]]]:
+    return get_extractor().extract_batch(texts)
 
 
 def propose_questions(slots: dict) -> List[str]:
@@ -1,92 +1,197 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
-from .schemas import RecommendRequest, RecommendResponse, Recommendation, Hit, Message
+import asyncio
+import json
+import logging
+import math
+import secrets
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from .schemas import RecommendRequest, Hit, Message, BatchRecommendRequest, CatalogDelta
 from .config import settings
-from .intent import extract_slots, propose_questions
-from .retriever import AlgoliaRetriever
-from .ranker import rerank
-from typing import List, Dict, Any, Tuple
+from .admission import Overloaded
+from .intent import extract_slots
+from .retriever import close_async_client
+from .generator import agenerate_stream, close_async_client as close_llm_client
+from .reload import get_reloader
+from . import warmup
+from .pipeline import get_context, build_filters, retrieve, build_response, recommend_for, open_session, begin_turn, end_turn, start_request_deadline
+from .batch import run_batch
+from .session import sessions
+from . import metrics
+from .metrics import timed, start_request_timings
+from typing import List, Dict, Any, Optional
 
-app = FastAPI(title="Agentic Device Advisor", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The server answers /health right away; the catalog index, intent tables and upstream
+    # connections are built in the background, and /ready reports when they are done
+    warmup.start_warm_up()
+    if warmup.serves_local_catalog():
+        get_reloader().start()
+    try:
+        yield
+    finally:
+        warmup.stop()
+        await close_async_client()
+        await close_llm_client()
+        if warmup.serves_local_catalog():
+            get_reloader().stop()
+
+
+app = FastAPI(title="Agentic Device Advisor", version="1.0.0", lifespan=lifespan)
+
+
+def _retry_after(exc: Overloaded) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+
+
+@app.exception_handler(Overloaded)
+async def shed_request(request: Request, exc: Overloaded):
+    """An upstream call shed by admission control with nothing to fall back to: fail fast."""
+    logger.warning(f"Shedding {request.url.path}: {exc}")
+    return JSONResponse(status_code=exc.status, content={"detail": str(exc)}, headers=_retry_after(exc))
 
 
 @app.get("/health")
 def health():
+    """Liveness: the process is up and serving."""
     return {"status": "ok"}
 
 
-def get_context(req: RecommendRequest) -> Tuple[str, List[Dict[str, str]]]:
-    if req.query:
-        return req.query, None
-    if req.messages:
-        last_user = ""
-        for m in reversed(req.messages):
-            if m.role == "user":
-                last_user = m.content
-                break
-        return last_user, [{"role": m.role, "content": m.content} for m in req.messages]
-    raise HTTPException(status_code=400, detail="No user text provided. Send 'query' or 'messages'.")
+@app.get("/ready")
+def ready():
+    """Readiness: 200 once warm-up is done, 503 before that and once shutdown starts."""
+    return JSONResponse(status_code=200 if warmup.is_ready() else 503, content=warmup.state())
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/recommend")
-def recommend(req: RecommendRequest, response_format: str = "json"):
-    user_text, messages = get_context(req)
-    print("the user text is: ", user_text)
-    slots = extract_slots(user_text)
-    print("the slots are: ", slots)
-
-    if req.budget_min is not None:
-        slots["budget_min"] = req.budget_min
-    if req.budget_max is not None:
-        slots["budget_max"] = req.budget_max
-
-    filters = {
-        "os": slots.get("os"),
-        "device_type": slots.get("device_type"),
-        "budget_min": slots.get("budget_min"),
-        "budget_max": slots.get("budget_max"),
-    }
-
-    retriever = AlgoliaRetriever()
-    results = retriever.search(user_text, filters=filters, hits_per_page=settings.MAX_HITS)
-    hits = results.get("hits", [])
-
-    reranked = rerank(hits, slots, user_text, top_k=settings.RERANK_TOP_K)
-    top_hits = reranked[:max(3, min(settings.RERANK_TOP_K, settings.RETURN_TOP_N*3))]
-
-    from .generator import generate
-    gen_out, used_fallback, conversational_response = generate(user_text, slots, top_hits, messages)
-    print("the conversational response: ", conversational_response)
-    print("the gen out: ", gen_out)
-    print("the used fallback: ", used_fallback)
+async def recommend(req: RecommendRequest, response_format: str = "json", include_timings: bool = False):
+    timings = start_request_timings()
+    start_request_deadline(req)
+    with timed("total"):
+        with timed("get_context"):
+            user_text, messages = get_context(req)
+        with timed("extract_slots"):
+            slots = extract_slots(user_text)
+        logger.debug(f"user text: {user_text!r}, slots: {slots}")
+
+        response, conversational_response = await recommend_for(req, user_text, messages, slots)
+    logger.debug(f"used fallback: {response.used_fallback_generator}, response: {conversational_response!r}")
 
     if response_format == "text":
         return conversational_response
 
-    recommendations = []
-    for rec in gen_out.get("recommendations", [])[:req.top_n]:
-        recommendations.append(Recommendation(
-            title=rec.get("title"),
-            price=rec.get("price"),
-            url=rec.get("url"),
-            score=0.0,
-            reasons=rec.get("reasons", []),
-            citations=rec.get("citations", [])
-        ))
-
-    clarifying = gen_out.get("clarifying_questions") or propose_questions(slots)
-
-    debug = {
-        "slots": slots,
-        "filters": filters,
-        "nbHits": results.get("nbHits"),
-        "used_local_json": settings.USE_LOCAL_JSON,
-        "index": settings.ALGOLIA_INDEX_NAME
-    }
-
-    return RecommendResponse(
-        recommendations=recommendations,
-        clarifying_questions=clarifying[:3],
-        used_fallback_generator=used_fallback,
-        debug=debug
-    )
\ No newline at end of file
+    if include_timings:
+        response.debug["timings"] = timings
+    return response
+
+
+@app.delete("/conversations/{conversation_id}")
+def end_conversation(conversation_id: str):
+    sessions.delete(conversation_id)
+    return {"conversation_id": conversation_id, "status": "deleted"}
+
+
+def _require_admin(key: Optional[str]):
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Set ADMIN_API_KEY to enable catalog administration")
+    if not key or not secrets.compare_digest(key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid X-Admin-Key")
+
+
+@app.post("/catalog/reload")
+async def reload_catalog(x_admin_key: Optional[str] = Header(default=None)):
+    """Rebuild the local catalog index from its file (and delta files) and swap it in once built."""
+    _require_admin(x_admin_key)
+    return await asyncio.wrap_future(get_reloader().reload())
+
+
+@app.post("/catalog/delta")
+async def apply_catalog_delta(delta: CatalogDelta, x_admin_key: Optional[str] = Header(default=None)):
+    """Upsert and delete local catalog items by objectID; lasts until the next full reload."""
+    _require_admin(x_admin_key)
+    try:
+        return await asyncio.wrap_future(get_reloader().apply(delta.model_dump()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/recommend/stream")
+async def recommend_stream(req: RecommendRequest):
+    """
+    Server-Sent Events variant of /recommend:
+    `retrieval` (slots, filters and reranked hits) as soon as reranking is done,
+    `token` events with the conversational text as the LLM writes it,
+    then `result` with the same body /recommend returns, or `error` when admission control sheds
+    the request (what /recommend answers with 429/503).
+    """
+    start_request_timings()
+    start_request_deadline(req)
+    with timed("get_context"):
+        user_text, messages = get_context(req)
+    with timed("extract_slots"):
+        slots = extract_slots(user_text)
+    session = open_session(req)
+
+    async def events():
+        async with session.lock if session else nullcontext():
+            try:
+                async for event in turn_events(*begin_turn(session, user_text, messages, slots)):
+                    yield event
+            except Overloaded as e:
+                # The 200 is already sent, so the shed request ends with an event instead
+                yield _sse("error", {"status": e.status, "detail": str(e), "retry_after": e.retry_after})
+
+    async def turn_events(messages: List[Dict[str, str]], slots: Dict[str, Any]):
+        filters = build_filters(req, slots)
+        results, top_hits = await retrieve(user_text, slots, filters, session)
+        yield _sse("retrieval", {
+            "slots": slots,
+            "filters": filters,
+            "nbHits": results.get("nbHits"),
+            "hits": [
+                {
+                    "objectID": h.get("objectID"),
+                    "title": h.get("title") or h.get("name"),
+                    "price": h.get("price"),
+                    "url": h.get("url"),
+                    "score": h.get("_advisorScore", 0.0)
+                }
+                for h in top_hits
+            ]
+        })
+
+        async for kind, payload in agenerate_stream(user_text, slots, top_hits, messages, bypass_cache=req.bypass_cache):
+            if kind == "token":
+                yield _sse("token", {"text": payload})
+            else:
+                gen_out, used_fallback, conversational_response = payload
+                with timed("response_build"):
+                    response = build_response(req, gen_out, used_fallback, slots, filters, results)
+                if session is not None:
+                    end_turn(session, user_text, conversational_response, slots, filters, results)
+                yield _sse("result", {**response.model_dump(), "conversational_response": conversational_response})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.post("/recommend/batch")
+async def recommend_batch(batch: BatchRecommendRequest):
+    """NDJSON stream with one result (or per-item error) per request in the batch."""
+    async def lines():
+        async for result in run_batch(batch.requests, concurrency=batch.concurrency, ordered=batch.ordered):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
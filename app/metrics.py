@@ -0,0 +1,189 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(labels[n] for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    le_label = f'le="{le}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le_label)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class CallbackGauge:
+    """Gauge or counter whose samples are read from `collect()` at scrape time."""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Tuple[str, ...],
+                 collect: Callable[[], List[Tuple[Tuple[str, ...], float]]]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.collect = collect
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.collect()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+REGISTRY: list = []
+
+stage_seconds = Histogram(
+    "advisor_stage_seconds",
+    "Time spent in each recommendation pipeline stage.",
+    labelnames=("stage",)
+)
+upstream_retries = Counter(
+    "advisor_upstream_retries_total",
+    "Retried upstream calls.",
+    labelnames=("upstream",)
+)
+upstream_hedges = Counter(
+    "advisor_upstream_hedges_total",
+    "Hedge calls sent after an upstream call outlived its latency percentile.",
+    labelnames=("upstream",)
+)
+fallbacks = Counter(
+    "advisor_fallbacks_total",
+    "Requests served by a fallback: local_retrieval instead of Algolia, template instead of the LLM.",
+    labelnames=("kind",)
+)
+template_replies = Counter(
+    "advisor_template_replies_total",
+    "Replies GENERATOR_MODE built from the reranked hits instead of calling the LLM, by reason.",
+    labelnames=("reason",)
+)
+admission_wait = Histogram(
+    "advisor_admission_wait_seconds",
+    "Time upstream calls waited for a concurrency slot and a rate-limit token.",
+    labelnames=("upstream", "priority")
+)
+admission_shed = Counter(
+    "advisor_admission_shed_total",
+    "Upstream calls shed by admission control, by reason (deadline, queue_full, rate_limit).",
+    labelnames=("upstream", "reason")
+)
+
+_caches: list = []
+_flights: list = []
+_schedulers: list = []
+
+
+def register_cache(cache):
+    _caches.append(cache)
+
+
+def register_flight(flight):
+    _flights.append(flight)
+
+
+def register_scheduler(scheduler):
+    _schedulers.append(scheduler)
+
+
+CallbackGauge("advisor_cache_hits_total", "Cache hits.", "counter", ("cache",),
+              lambda: [((c.name,), c.hits) for c in _caches])
+CallbackGauge("advisor_cache_misses_total", "Cache misses.", "counter", ("cache",),
+              lambda: [((c.name,), c.misses) for c in _caches])
+CallbackGauge("advisor_singleflight_coalesced_total", "Calls that joined an identical in-flight call.", "counter", ("flight",),
+              lambda: [((f.name,), f.coalesced) for f in _flights])
+CallbackGauge("advisor_admission_queue_depth", "Upstream calls waiting for a slot.", "gauge", ("upstream", "priority"),
+              lambda: [((s.name, name), n) for s in _schedulers for name, n in s.stats()["queued"].items()])
+CallbackGauge("advisor_admission_in_flight", "Upstream calls holding a slot.", "gauge", ("upstream",),
+              lambda: [((s.name,), s.in_flight) for s in _schedulers])
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Per-request stage timings (milliseconds), set by the endpoint and filled in by `timed`
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 3)
@@ -0,0 +1,180 @@
+import logging
+from fastapi import HTTPException
+from typing import List, Dict, Any, Optional, Tuple
+
+from .schemas import RecommendRequest, RecommendResponse, Recommendation
+from .config import settings
+from .intent import propose_questions
+from .retriever import AlgoliaRetriever
+from .ranker import rerank
+from .generator import agenerate
+from .metrics import timed
+from .deadline import start_deadline
+from .session import Session, sessions
+
+logger = logging.getLogger(__name__)
+
+
+def get_context(req: RecommendRequest) -> Tuple[str, List[Dict[str, str]]]:
+    if req.query:
+        return req.query, None
+    if req.messages:
+        last_user = ""
+        for m in reversed(req.messages):
+            if m.role == "user":
+                last_user = m.content
+                break
+        return last_user, [{"role": m.role, "content": m.content} for m in req.messages]
+    raise HTTPException(status_code=400, detail="No user text provided. Send 'query' or 'messages'.")
+
+
+def start_request_deadline(req: RecommendRequest):
+    """Start the clock the retriever and generator budget their upstream calls against."""
+    start_deadline(req.deadline_ms / 1000 if req.deadline_ms else settings.REQUEST_DEADLINE)
+
+
+def build_filters(req: RecommendRequest, slots: Dict[str, Any]) -> Dict[str, Any]:
+    if req.budget_min is not None:
+        slots["budget_min"] = req.budget_min
+    if req.budget_max is not None:
+        slots["budget_max"] = req.budget_max
+
+    return {
+        "os": slots.get("os"),
+        "device_type": slots.get("device_type"),
+        "budget_min": slots.get("budget_min"),
+        "budget_max": slots.get("budget_max"),
+    }
+
+
+async def retrieve(
+    user_text: str,
+    slots: Dict[str, Any],
+    filters: Dict[str, Any],
+    session: Optional[Session] = None
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    results = session.reusable_results(filters, slots) if session else None
+    if results is not None:
+        logger.info(f"Conversation {session.id}: filters unchanged, reusing the last retrieval")
+    else:
+        retriever = AlgoliaRetriever()
+        with timed("retrieval"):
+            results = await retriever.asearch(user_text, filters=filters, hits_per_page=settings.MAX_HITS)
+    # rerank annotates and reorders the hits; the session keeps its own copy for later turns
+    hits = [dict(h) for h in results.get("hits", [])]
+
+    with timed("rerank"):
+        reranked = rerank(hits, slots, user_text, top_k=settings.RERANK_TOP_K)
+    top_hits = reranked[:max(3, min(settings.RERANK_TOP_K, settings.RETURN_TOP_N*3))]
+    return results, top_hits
+
+
+def open_session(req: RecommendRequest) -> Optional[Session]:
+    if not req.conversation_id:
+        return None
+    session, created = sessions.get_or_create(req.conversation_id)
+    if created:
+        logger.info(f"Conversation {session.id} started")
+    return session
+
+
+def begin_turn(
+    session: Optional[Session],
+    user_text: str,
+    messages: List[Dict[str, str]],
+    slots: Dict[str, Any]
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Messages and slots for this turn: as sent, or folded into the conversation's state.
+    Call with the session's lock held, and close the turn with `end_turn`.
+    """
+    if session is None:
+        return messages, slots
+    sessions.load(session)
+    return session.context_messages(user_text), session.merge_slots(slots)
+
+
+def end_turn(
+    session: Session,
+    user_text: str,
+    reply: str,
+    slots: Dict[str, Any],
+    filters: Dict[str, Any],
+    results: Dict[str, Any]
+):
+    session.finish_turn(user_text, reply, slots, filters, results)
+    sessions.save(session)
+
+
+def build_response(
+    req: RecommendRequest,
+    gen_out: Dict[str, Any],
+    used_fallback: bool,
+    slots: Dict[str, Any],
+    filters: Dict[str, Any],
+    results: Dict[str, Any]
+) -> RecommendResponse:
+    recommendations = []
+    # Template replies carry the rerank score; the model's recommendations don't
+    scored = gen_out.get("generator") == "template"
+    for rec in gen_out.get("recommendations", [])[:req.top_n]:
+        recommendations.append(Recommendation(
+            title=rec.get("title"),
+            price=rec.get("price"),
+            url=rec.get("url"),
+            score=rec.get("score", 0.0) if scored else 0.0,
+            reasons=rec.get("reasons", []),
+            citations=rec.get("citations", [])
+        ))
+
+    clarifying = gen_out.get("clarifying_questions") or propose_questions(slots)
+
+    debug = {
+        "slots": slots,
+        "filters": filters,
+        "nbHits": results.get("nbHits"),
+        "used_local_json": settings.USE_LOCAL_JSON,
+        "generator": gen_out.get("generator", "llm"),
+        "index": settings.ALGOLIA_INDEX_NAME
+    }
+
+    return RecommendResponse(
+        recommendations=recommendations,
+        clarifying_questions=clarifying[:3],
+        used_fallback_generator=used_fallback,
+        conversation_id=req.conversation_id,
+        debug=debug
+    )
+
+
+async def recommend_for(
+    req: RecommendRequest,
+    user_text: str,
+    messages: List[Dict[str, str]],
+    slots: Dict[str, Any]
+) -> Tuple[RecommendResponse, str]:
+    """Retrieval, reranking and generation for one request whose slots are already extracted."""
+    session = open_session(req)
+    if session is None:
+        return await _recommend(req, user_text, messages, slots, None)
+    async with session.lock:
+        messages, slots = begin_turn(session, user_text, messages, slots)
+        return await _recommend(req, user_text, messages, slots, session)
+
+
+async def _recommend(
+    req: RecommendRequest,
+    user_text: str,
+    messages: List[Dict[str, str]],
+    slots: Dict[str, Any],
+    session: Optional[Session]
+) -> Tuple[RecommendResponse, str]:
+    filters = build_filters(req, slots)
+    results, top_hits = await retrieve(user_text, slots, filters, session)
+
+    gen_out, used_fallback, conversational_response = await agenerate(user_text, slots, top_hits, messages, bypass_cache=req.bypass_cache)
+    with timed("response_build"):
+        response = build_response(req, gen_out, used_fallback, slots, filters, results)
+    if session is not None:
+        end_turn(session, user_text, conversational_response, slots, filters, results)
+    return response, conversational_response
@@ -0,0 +1,153 @@
+import json
+import logging
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+HIT_FIELDS = ("title", "price", "url", "brand", "os", "ram", "camera", "description")
+
+PROMPT_HEADER = """
+You are a helpful AI advisor recommending electronic devices based on user needs.
+User query: {user_text}
+Extracted slots: {slots}
+Conversation history (if any): {history}
+
+Available products from search (top relevant hits):
+{hits}
+"""
+
+PROMPT_INSTRUCTIONS = """
+Instructions:
+- If the user asks for an explanation (e.g., 'what is RAM?'), explain the term simply in 1-2 sentences, then relate it to device recommendations (e.g., suggest minimum specs like 8GB RAM for daily use).
+- Recommend 3-5 top products that best match the slots and query. For each:
+  - Provide title, price, url.
+  - List 2-3 reasons why it matches, citing specific attributes (e.g., 'High RAM: 16GB' or 'Great camera: 48MP with OIS').
+- Be conversational, engaging, and adapt to the conversation history (e.g., refine based on prior user inputs).
+- If information is missing (e.g., no OS preference), ask 1-3 relevant clarifying questions (e.g., 'Do you prefer Windows or macOS?').
+- If no good matches, suggest alternatives or ask for more details.
+- Output in JSON: {"recommendations": [{"title": str, "price": float, "url": str, "reasons": [str], "citations": [str]}], "clarifying_questions": [str]}
+- Follow with a conversational response (after a separator '---') incorporating the recommendations and questions in natural language.
+- Do not use hardcoded responses; base everything on the provided data.
+"""
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """tiktoken encoding for TOKENIZER_ENCODING, or None when tiktoken or its BPE file is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding {settings.TOKENIZER_ENCODING} unavailable ({e}); estimating token counts")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Token count under the model's encoding; an upper-leaning estimate without tiktoken."""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # English prose and compact JSON run close to 4 characters a token; 3 keeps the estimate on the safe side
+    return (len(text) + 2) // 3
+
+
+def _hit_values(hit: Dict[str, Any]) -> tuple:
+    return (
+        hit.get("title") or hit.get("name") or "Unknown Product",
+        hit.get("price"),
+        hit.get("url"),
+        hit.get("brand"),
+        hit.get("os"),
+        hit.get("ram"),
+        hit.get("camera"),
+        hit.get("shortDescription") or hit.get("description") or "",
+    )
+
+
+@lru_cache(maxsize=4096)
+def _hit_prefix(values: tuple) -> Tuple[str, int]:
+    """Serialized hit up to its score, with its token count; shared by every prompt citing the product."""
+    prefix = compact_json(dict(zip(HIT_FIELDS, values)))[:-1] + ',"score":'
+    return prefix, count_tokens(prefix)
+
+
+def hit_fragment(hit: Dict[str, Any]) -> Tuple[str, int]:
+    """Compact JSON for one hit in the prompt and its token count."""
+    values = _hit_values(hit)
+    score = compact_json(round(float(hit.get("_advisorScore", 0.0)), 2)) + "}"
+    try:
+        prefix, tokens = _hit_prefix(values)
+    except TypeError:
+        # Unhashable attribute values (lists, dicts) skip the fragment cache
+        prefix = compact_json(dict(zip(HIT_FIELDS, values)))[:-1] + ',"score":'
+        tokens = count_tokens(prefix)
+    return prefix + score, tokens + count_tokens(score)
+
+
+def _render(user_text: str, slots_json: str, history: List[str], hits: List[str]) -> str:
+    return PROMPT_HEADER.format(
+        user_text=user_text,
+        slots=slots_json,
+        history="\n".join(history),
+        hits="[" + ",".join(hits) + "]",
+    ) + PROMPT_INSTRUCTIONS
+
+
+def build_prompt(
+    user_text: str,
+    slots: Dict[str, Any],
+    top_hits: List[Dict[str, Any]],
+    messages: Optional[List[Dict[str, str]]] = None,
+    budget: Optional[int] = None
+) -> str:
+    """
+    Prompt for the recommendation call, packed into `budget` tokens (PROMPT_TOKEN_BUDGET).
+    The query, slots and instructions are always sent. The rest is added by priority while it fits:
+    the first PROMPT_MIN_HITS hits, then history newest first, then the remaining hits.
+    """
+    budget = budget or settings.PROMPT_TOKEN_BUDGET
+    slots_json = compact_json(slots)
+    fixed = count_tokens(_render(user_text, slots_json, [], []))
+
+    hits = [hit_fragment(hit) for hit in top_hits[:settings.PROMPT_MAX_HITS]]
+    recent = (messages or [])[-settings.PROMPT_HISTORY_MESSAGES:] if settings.PROMPT_HISTORY_MESSAGES else []
+    history = [f"{m['role']}: {m['content']}" for m in recent]
+
+    # Each item also costs about one token for its separator
+    used = fixed
+    n_hits = 0
+    min_hits = min(settings.PROMPT_MIN_HITS, len(hits))
+    while n_hits < min_hits and used + hits[n_hits][1] + 1 <= budget:
+        used += hits[n_hits][1] + 1
+        n_hits += 1
+    n_history = 0
+    if n_hits == min_hits:
+        for line in reversed(history):
+            cost = count_tokens(line) + 1
+            if used + cost > budget:
+                break
+            used += cost
+            n_history += 1
+        while n_hits < len(hits) and used + hits[n_hits][1] + 1 <= budget:
+            used += hits[n_hits][1] + 1
+            n_hits += 1
+
+    kept_history = history[len(history) - n_history:]
+    prompt = _render(user_text, slots_json, kept_history, [h[0] for h in hits[:n_hits]])
+    # Fragment counts are summed separately; confirm on the assembled text and shed the lowest priority items
+    while count_tokens(prompt) > budget and (n_hits or kept_history):
+        if n_hits > min_hits or not kept_history:
+            n_hits -= 1
+        else:
+            kept_history = kept_history[1:]
+        prompt = _render(user_text, slots_json, kept_history, [h[0] for h in hits[:n_hits]])
+
+    if n_hits < len(hits) or len(kept_history) < len(history):
+        logger.info(f"Prompt packed into {budget} tokens: {n_hits}/{len(hits)} hits, {len(kept_history)}/{len(history)} history messages")
+    return prompt
@@ -1,9 +1,18 @@
 
 from typing import List, Dict, Any
 import math
+import re
 
+import numpy as np
 
-def score_hit(hit: Dict[str, Any], slots: Dict[str, Any], query: str) -> float:
+from .topk import top_k_desc
+
+
+def score_breakdown(hit: Dict[str, Any], slots: Dict[str, Any], query: str) -> Dict[str, float]:
+    """
+    Parts of `score_hit` before clamping: "base" (search relevance) and each boost or penalty
+    that applied, keyed by what it rewards, in the order they are added.
+    """
     # Heuristic scoring combining Algolia ranking info + slot alignment
     base = 0.0
     if "_rankingInfo" in hit:
@@ -11,48 +20,176 @@ def score_hit(hit: Dict[str, Any], slots: Dict[str, Any], query: str) -> float:
         base = 1 / (1 + b)
     elif "_score" in hit:
         base = min(1.0, hit["_score"] / 10.0)
+    parts = {"base": base}
 
-    boost = 0.0
     title = (hit.get("title") or hit.get("name") or "").lower()
     cats = " ".join(hit.get("categories") or []).lower()
 
     if slots.get("device_type") == "laptop" and "laptop" in cats + " " + title:
-        boost += 0.2
+        parts["device_type"] = 0.2
     if slots.get("device_type") == "phone" and ("phone" in cats or "iphone" in title or "android" in title):
-        boost += 0.2
+        parts["device_type"] = 0.2
     if slots.get("os"):
         osv = (hit.get("os") or "").lower()
         if slots["os"].lower() in osv or slots["os"].lower() in title:
-            boost += 0.2
+            parts["os"] = 0.2
     if slots.get("use_case") == "programming":
         if any(k in title for k in ["air","ultrabook","thin","light"]):
-            boost += 0.1
+            parts["portability"] = 0.1
         ram = hit.get("ram")
         try:
             if isinstance(ram, (int,float)) and ram >= 16:
-                boost += 0.1
+                parts["ram"] = 0.1
         except:
             pass
     if slots.get("use_case") == "social_media":
         cam = hit.get("camera") or title
         if any(k in str(cam).lower() for k in ["stabilization","4k","1080p","ois","pro camera","hdr"]):
-            boost += 0.2
+            parts["camera"] = 0.2
 
     price = hit.get("price")
     if price is not None:
         bmin = slots.get("budget_min")
         bmax = slots.get("budget_max")
-        if bmin is not None and price < bmin: boost -= 0.3
-        if bmax is not None and price > bmax: boost -= 0.3
+        if bmin is not None and price < bmin: parts["budget_min"] = -0.3
+        if bmax is not None and price > bmax: parts["budget_max"] = -0.3
 
-    return max(0.0, min(1.0, base + boost))
+    return parts
+
+
+def score_hit(hit: Dict[str, Any], slots: Dict[str, Any], query: str) -> float:
+    parts = score_breakdown(hit, slots, query)
+    boost = 0.0
+    for name, value in parts.items():
+        if name != "base":
+            boost += value
+    return max(0.0, min(1.0, parts["base"] + boost))
 
 
 def rerank(hits: List[Dict[str, Any]], slots: Dict[str, Any], query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    if len(hits) >= VECTORIZE_MIN_HITS:
+        return rerank_vectorized(hits, slots, query, top_k)
     scored = [(score_hit(h, slots, query), h) for h in hits]
     scored.sort(key=lambda x: x[0], reverse=True)
     out = []
     for s, h in scored[:top_k]:
         h["_advisorScore"] = s
+        h["_advisorScoreParts"] = score_breakdown(h, slots, query)
+        out.append(h)
+    return out
+
+
+# Keyword-match bits precomputed per hit; they don't depend on the query
+LAPTOP_MATCH = 1        # "laptop" in categories or title
+PHONE_MATCH = 2         # "phone" in categories, or "iphone"/"android" in title
+LIGHT_TITLE = 4         # programming portability keywords in title
+SOCIAL_CAMERA = 8       # video/photo keywords in camera (or title when no camera)
+RAM_16GB = 16           # numeric ram >= 16
+
+LIGHT_KEYWORDS = ["air","ultrabook","thin","light"]
+CAMERA_KEYWORDS = ["stabilization","4k","1080p","ois","pro camera","hdr"]
+# One C-level scan per string instead of a Python loop over the keywords
+_LIGHT_RE = re.compile("|".join(map(re.escape, LIGHT_KEYWORDS)))
+_CAMERA_RE = re.compile("|".join(map(re.escape, CAMERA_KEYWORDS)))
+
+# Below this many hits the NumPy setup costs more than the Python loop
+VECTORIZE_MIN_HITS = 64
+
+
+class HitFeatures:
+    """Columnar features of a hit list, extracted once, for scoring every hit with array arithmetic."""
+
+    def __init__(self, hits: List[Dict[str, Any]]):
+        self.n = len(hits)
+        ranking_sum = []
+        search_score = []
+        price = []
+        flags = []
+        self.titles = []
+        self.oses = []
+
+        nan = float("nan")
+        for hit in hits:
+            info = hit.get("_rankingInfo") if "_rankingInfo" in hit else None
+            if info is not None:
+                ranking_sum.append(info.get("nbExactWords", 0) + info.get("typo", 0))
+                search_score.append(nan)
+            else:
+                ranking_sum.append(nan)
+                search_score.append(hit["_score"] if "_score" in hit else nan)
+
+            title = (hit.get("title") or hit.get("name") or "").lower()
+            cats = " ".join(hit.get("categories") or []).lower()
+            f = 0
+            # "laptop" has no space, so it can't straddle the cats/title join score_hit uses
+            if "laptop" in cats or "laptop" in title:
+                f |= LAPTOP_MATCH
+            if "phone" in cats or "iphone" in title or "android" in title:
+                f |= PHONE_MATCH
+            if _LIGHT_RE.search(title):
+                f |= LIGHT_TITLE
+            cam = hit.get("camera")
+            if _CAMERA_RE.search(str(cam).lower() if cam else title):
+                f |= SOCIAL_CAMERA
+            ram = hit.get("ram")
+            if isinstance(ram, (int,float)) and ram >= 16:
+                f |= RAM_16GB
+            flags.append(f)
+
+            p = hit.get("price")
+            price.append(nan if p is None else p)
+            self.titles.append(title)
+            self.oses.append((hit.get("os") or "").lower())
+
+        # NaN marks "no _rankingInfo" / "no _score" / "no price"
+        self.ranking_sum = np.array(ranking_sum, dtype=np.float64)
+        self.search_score = np.array(search_score, dtype=np.float64)
+        self.price = np.array(price, dtype=np.float64)
+        self.flags = np.array(flags, dtype=np.uint8)
+
+    def scores(self, slots: Dict[str, Any]) -> np.ndarray:
+        """Same values as `score_hit` for every hit; boosts are added in the same order so floats match exactly."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            base = np.where(
+                ~np.isnan(self.ranking_sum), 1 / (1 + self.ranking_sum),
+                np.where(~np.isnan(self.search_score), np.minimum(1.0, self.search_score / 10.0), 0.0)
+            )
+
+        flags = self.flags
+        boost = np.zeros(self.n, dtype=np.float64)
+        if slots.get("device_type") == "laptop":
+            boost += np.where(flags & LAPTOP_MATCH, 0.2, 0.0)
+        if slots.get("device_type") == "phone":
+            boost += np.where(flags & PHONE_MATCH, 0.2, 0.0)
+        if slots.get("os"):
+            osl = slots["os"].lower()
+            os_match = [osl in osv or osl in title for osv, title in zip(self.oses, self.titles)]
+            boost += np.where(np.array(os_match, dtype=bool), 0.2, 0.0)
+        if slots.get("use_case") == "programming":
+            boost += np.where(flags & LIGHT_TITLE, 0.1, 0.0)
+            boost += np.where(flags & RAM_16GB, 0.1, 0.0)
+        if slots.get("use_case") == "social_media":
+            boost += np.where(flags & SOCIAL_CAMERA, 0.2, 0.0)
+
+        # NaN (no price) compares False, matching the `price is not None` guard
+        bmin = slots.get("budget_min")
+        bmax = slots.get("budget_max")
+        if bmin is not None:
+            boost += np.where(self.price < bmin, -0.3, 0.0)
+        if bmax is not None:
+            boost += np.where(self.price > bmax, -0.3, 0.0)
+
+        return np.maximum(0.0, np.minimum(1.0, base + boost))
+
+
+def rerank_vectorized(hits: List[Dict[str, Any]], slots: Dict[str, Any], query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    """`rerank` over columnar features with partial top-k selection; identical scores and order."""
+    scores = HitFeatures(hits).scores(slots)
+    out = []
+    for i in top_k_desc(scores, top_k):
+        h = hits[i]
+        h["_advisorScore"] = float(scores[i])
+        # Only the returned hits pay for the per-part breakdown
+        h["_advisorScoreParts"] = score_breakdown(h, slots, query)
         out.append(h)
     return out
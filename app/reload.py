@@ -0,0 +1,160 @@
+"""
+Hot reload of the local catalog.
+
+The new index is built on a background thread and swapped in with `set_catalog_index`; searches
+already running keep the index they started with. A reload is triggered by:
+    - a change to LOCAL_JSON_PATH (the manifest of a compact catalog), polled every CATALOG_WATCH_INTERVAL seconds
+    - a new or changed delta file (*.json) in CATALOG_DELTA_DIR, applied in file name order
+    - POST /catalog/reload and POST /catalog/delta
+
+A delta is {"upsert": [items], "delete": [objectIDs]} (see `apply_delta`). Delta files are replayed
+on every full reload, the first one during warm-up included, so they hold until the base catalog is
+rewritten with them and they are removed; a delta posted to the API lasts until the next full reload.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .catalog import (
+    CatalogIndex, apply_delta, build_index, get_catalog_index, load_delta, loaded_catalog_index, set_catalog_index
+)
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+catalog_reloads = Counter(
+    "advisor_catalog_reloads_total",
+    "Local catalog index swaps by kind (full, delta) and failed attempts.",
+    labelnames=("kind",)
+)
+
+
+def _mtime(path: str) -> Optional[float]:
+    if os.path.isdir(path):
+        path = os.path.join(path, "manifest.json")
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class CatalogReloader:
+    """Rebuilds or patches the index for `path` off the request path, one job at a time."""
+
+    def __init__(self, path: str, delta_dir: Optional[str] = None, interval: float = 0.0):
+        self.path = path
+        self.delta_dir = delta_dir
+        self.interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog-reload")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # What the current index was built from: the catalog's mtime and each delta file's
+        self._mtime = _mtime(path)
+        self._applied: Dict[str, float] = {}
+
+    def reload(self) -> Future:
+        """Rebuild from the catalog file and the delta files."""
+        return self._executor.submit(self._run, "full", self._reload)
+
+    def apply(self, delta: Dict[str, Any]) -> Future:
+        """Apply one delta to the current index."""
+        return self._executor.submit(self._run, "delta", lambda: apply_delta(get_catalog_index(self.path), delta))
+
+    def check(self) -> Optional[Future]:
+        """Schedule whatever the files on disk call for: a full reload, new deltas or nothing."""
+        mtime = _mtime(self.path)
+        if mtime is not None and mtime != self._mtime:
+            return self.reload()
+        deltas = self._pending_deltas()
+        if deltas:
+            return self._executor.submit(self._run, "delta", lambda: self._apply_files(get_catalog_index(self.path), deltas))
+        return None
+
+    def _run(self, kind: str, build) -> Dict[str, Any]:
+        start = time.perf_counter()
+        current = loaded_catalog_index(self.path)
+        try:
+            index = build()
+        except Exception:
+            catalog_reloads.inc(kind="failed")
+            raise
+        if index is current:
+            # Every pending delta file failed to load: nothing to swap
+            return {"kind": kind, "items": len(index), "seconds": round(time.perf_counter() - start, 3)}
+        set_catalog_index(self.path, index)
+        catalog_reloads.inc(kind=kind)
+        seconds = time.perf_counter() - start
+        logger.info(f"Catalog {kind} reload of {self.path}: {len(index)} items in {seconds:.2f}s")
+        return {"kind": kind, "items": len(index), "seconds": round(seconds, 3)}
+
+    def _reload(self) -> CatalogIndex:
+        mtime = _mtime(self.path)
+        index = build_index(self.path)
+        self._applied = {}
+        index = self._apply_files(index, self._pending_deltas())
+        self._mtime = mtime
+        return index
+
+    def _delta_files(self) -> List[Tuple[str, float]]:
+        if not self.delta_dir:
+            return []
+        files = []
+        for path in sorted(glob.glob(os.path.join(self.delta_dir, "*.json"))):
+            mtime = _mtime(path)
+            if mtime is not None:
+                files.append((path, mtime))
+        return files
+
+    def _pending_deltas(self) -> List[Tuple[str, float]]:
+        return [(path, mtime) for path, mtime in self._delta_files() if self._applied.get(path) != mtime]
+
+    def _apply_files(self, index: CatalogIndex, files: List[Tuple[str, float]]) -> CatalogIndex:
+        for path, mtime in files:
+            try:
+                delta = load_delta(path)
+            except Exception:
+                # A half-written or invalid file is left out, not applied, and retried on the next check
+                catalog_reloads.inc(kind="failed")
+                logger.exception(f"Skipping catalog delta {path}")
+                continue
+            index = apply_delta(index, delta)
+            self._applied[path] = mtime
+        return index
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._watch, name="catalog-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._executor.shutdown(wait=True)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                future = self.check()
+                if future is not None:
+                    future.result()
+            except Exception:
+                logger.exception(f"Catalog reload of {self.path} failed; keeping the current index")
+
+
+_reloader: Optional[CatalogReloader] = None
+_reloader_lock = threading.Lock()
+
+
+def get_reloader() -> CatalogReloader:
+    global _reloader
+    with _reloader_lock:
+        if _reloader is None:
+            _reloader = CatalogReloader(settings.LOCAL_JSON_PATH, settings.CATALOG_DELTA_DIR, settings.CATALOG_WATCH_INTERVAL)
+        return _reloader
@@ -1,10 +1,91 @@
-import json, httpx
-from typing import Dict, Any, Optional
-from tenacity import retry, stop_after_attempt, wait_exponential
+import asyncio
+import copy
+import logging
+import time
+import httpx
+from typing import Dict, Any, List, Optional
+from tenacity import retry, retry_if_exception_type, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 
 from .config import settings
+from .catalog import (
+    ATTRIBUTES_TO_RETRIEVE, FACET_FILTERS, PRICE_CEILING, PRICE_FLOOR,
+    catalog_generation, get_catalog_index, loaded_catalog_index
+)
+from .admission import Overloaded, Scheduler
+from .cache import Cache, CacheBackend, make_key, normalize_query
+from .deadline import LatencyTracker, has_budget, hedged, time_left
+from .singleflight import SingleFlight
+from .metrics import fallbacks, register_cache, register_flight, upstream_hedges, upstream_retries
+
+logger = logging.getLogger(__name__)
 
 ALGOLIA_HOST_TMPL = "https://{app_id}-dsn.algolia.net/1/indexes/{index}/query"
+# Algolia's own fallback hosts for the application, tried after the DSN host
+ALGOLIA_FALLBACK_HOST_TMPL = "https://{app_id}-{n}.algolianet.com/1/indexes/{index}/query"
+ALGOLIA_PATH_TMPL = "{host}/1/indexes/{index}/query"
+ALGOLIA_ISALIVE_TMPL = "https://{app_id}-dsn.algolia.net/1/isalive"
+
+_async_client: Optional[httpx.AsyncClient] = None
+
+retrieval_cache = Cache(
+    "retrieval",
+    ttl=settings.RETRIEVAL_CACHE_TTL,
+    maxsize=settings.RETRIEVAL_CACHE_SIZE,
+    enabled=settings.RETRIEVAL_CACHE_ENABLED
+)
+
+retrieval_flight = SingleFlight("retrieval", timeout=settings.RETRIEVAL_FLIGHT_TIMEOUT)
+register_cache(retrieval_cache)
+register_flight(retrieval_flight)
+
+
+algolia_latency = LatencyTracker()
+algolia_scheduler = Scheduler(
+    "algolia",
+    settings.ALGOLIA_MAX_CONCURRENCY,
+    rate=settings.ALGOLIA_RATE_LIMIT,
+    burst=settings.ALGOLIA_RATE_BURST,
+    max_queue=settings.ADMISSION_QUEUE_SIZE,
+    min_budget=settings.ALGOLIA_MIN_BUDGET
+)
+
+
+def _count_retry(retry_state):
+    upstream_retries.inc(upstream="algolia")
+
+
+def _out_of_time(retry_state) -> bool:
+    return not has_budget(settings.ALGOLIA_MIN_BUDGET)
+
+
+def set_retrieval_cache_backend(backend: CacheBackend):
+    """Swap the store behind the retrieval cache, e.g. for one shared by all workers."""
+    retrieval_cache.backend = backend
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Process-wide async HTTP client so concurrent requests reuse pooled connections."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(timeout=settings.ALGOLIA_TIMEOUT)
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def open_connection(timeout: float):
+    """One request to Algolia's health endpoint so the pool holds a connection before the first search."""
+    if settings.ALGOLIA_HOST:
+        url = f"{settings.ALGOLIA_HOST.rstrip('/')}/1/isalive"
+    else:
+        url = ALGOLIA_ISALIVE_TMPL.format(app_id=settings.ALGOLIA_APP_ID)
+    r = await get_async_client().get(url, headers=AlgoliaRetriever()._headers(), timeout=timeout)
+    logger.info(f"Algolia connection open ({url}: {r.status_code})")
 
 
 class AlgoliaRetriever:
@@ -15,91 +96,210 @@ class AlgoliaRetriever:
         self.timeout = settings.ALGOLIA_TIMEOUT
 
     def _endpoint(self):
+        if settings.ALGOLIA_HOST:
+            return ALGOLIA_PATH_TMPL.format(host=settings.ALGOLIA_HOST.rstrip("/"), index=self.index)
         return ALGOLIA_HOST_TMPL.format(app_id=self.app_id, index=self.index)
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.2, min=0.2, max=2))
-    def search(
-        self,
-        query: str,
-        filters: Optional[Dict[str, Any]] = None,
-        hits_per_page: Optional[int] = None
-    ) -> Dict[str, Any]:
-        if settings.USE_LOCAL_JSON or not (self.app_id and self.api_key):
-            return self._search_local(query, filters, hits_per_page or settings.HITS_PER_PAGE)
+    def _endpoints(self) -> List[str]:
+        """Where a query and its hedges go, in order: the DSN host, then the fallback hosts."""
+        if settings.ALGOLIA_HOST:
+            return [self._endpoint()]
+        return [self._endpoint()] + [
+            ALGOLIA_FALLBACK_HOST_TMPL.format(app_id=self.app_id, n=n, index=self.index) for n in (1, 2, 3)
+        ]
 
-        headers = {
+    def _hedge_delay(self) -> Optional[float]:
+        if settings.ALGOLIA_HEDGE_PERCENTILE <= 0:
+            return None
+        latency = algolia_latency.percentile(settings.ALGOLIA_HEDGE_PERCENTILE)
+        return None if latency is None else max(settings.ALGOLIA_HEDGE_MIN_DELAY, latency)
+
+    def _use_local(self) -> bool:
+        return settings.USE_LOCAL_JSON or not (self.app_id and self.api_key)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
             "X-Algolia-Application-Id": self.app_id,
             "X-Algolia-API-Key": self.api_key,
             "Content-Type": "application/json"
         }
+
+    def _params(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        hits_per_page: Optional[int]
+    ) -> Dict[str, Any]:
         params = {
             "query": query,
             "hitsPerPage": hits_per_page or settings.HITS_PER_PAGE,
-            "attributesToRetrieve": [
-                "name","title","price","brand","categories","image","url",
-                "objectID","description","shortDescription","rating","weight",
-                "os","ram","storage","camera","cpu","gpu"
-            ],
+            "attributesToRetrieve": ATTRIBUTES_TO_RETRIEVE,
             "getRankingInfo": True
         }
         if filters:
             filter_clauses = []
             numeric_filters = []
-            if filters.get("brand"):
-                filter_clauses.append(f'brand:"{filters["brand"]}"')
-            if filters.get("os"):
-                filter_clauses.append(f'os:"{filters["os"]}"')
-            if filters.get("device_type"):
-                filter_clauses.append(f'categories:"{filters["device_type"]}"')
-            if filters.get("budget_min") is not None or filters.get("budget_max") is not None:
-                mn = filters.get("budget_min", 0)
-                mx = filters.get("budget_max", 10**9)
-                numeric_filters.append(f"price>={mn}")
-                numeric_filters.append(f"price<={mx}")
+            for key, field in FACET_FILTERS:
+                if filters.get(key):
+                    filter_clauses.append(f'{field}:"{filters[key]}"')
+            mn = filters.get("budget_min")
+            mx = filters.get("budget_max")
+            if mn is not None or mx is not None:
+                numeric_filters.append(f"price>={PRICE_FLOOR if mn is None else mn}")
+                numeric_filters.append(f"price<={PRICE_CEILING if mx is None else mx}")
             if filter_clauses:
                 params["filters"] = " AND ".join(filter_clauses)
             if numeric_filters:
                 params["numericFilters"] = numeric_filters  # Now flat list
+        return params
+
+    def _cache_key(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        hits_per_page: Optional[int]
+    ) -> str:
+        # Local results are keyed by the index they were searched on: after a catalog reload
+        # later searches miss, even when one still running on the old index stores its results
+        source = f"local@{catalog_generation()}" if self._use_local() else self.index
+        return make_key(source, normalize_query(query), filters or {}, hits_per_page or settings.HITS_PER_PAGE)
+
+    def search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        hits_per_page: Optional[int] = None
+    ) -> Dict[str, Any]:
+        key = self._cache_key(query, filters, hits_per_page)
+        results = retrieval_cache.get(key)
+        if results is None:
+            results = self._search(query, filters, hits_per_page)
+            retrieval_cache.set(key, results)
+        return results
+
+    async def asearch(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        hits_per_page: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Non-blocking `search`: Algolia over a shared connection pool, local search off the event loop."""
+        key = self._cache_key(query, filters, hits_per_page)
+        results = retrieval_cache.get(key)
+        if results is None:
+            if not self._use_local() and not has_budget(settings.ALGOLIA_MIN_BUDGET) and self._fallback_index():
+                return await self._asearch_fallback(query, filters, hits_per_page, "no time left for Algolia")
+            try:
+                # Identical concurrent queries share one upstream call
+                results = await retrieval_flight.do(
+                    key, lambda: self._asearch_and_store(key, query, filters, hits_per_page),
+                    timeout=time_left(settings.RETRIEVAL_FLIGHT_TIMEOUT, settings.ALGOLIA_MIN_BUDGET)
+                )
+            except Exception as e:
+                if self._use_local() or not self._fallback_index():
+                    raise
+                return await self._asearch_fallback(query, filters, hits_per_page, f"{type(e).__name__}: {e}")
+            results = copy.deepcopy(results)
+        return results
 
-        url = self._endpoint()
-        with httpx.Client(timeout=self.timeout) as client:
-            r = client.post(url, json={"params": _encode_params(params)})
+    def _fallback_index(self):
+        # Only an index that is already loaded: building one would blow the deadline it is meant to save
+        return loaded_catalog_index(settings.LOCAL_JSON_PATH) if settings.RETRIEVAL_FALLBACK_LOCAL else None
+
+    async def _asearch_fallback(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        hits_per_page: Optional[int],
+        reason: str
+    ) -> Dict[str, Any]:
+        """Local catalog results in place of Algolia's; not cached, so Algolia answers the next request."""
+        logger.warning(f"Serving retrieval from the local catalog ({reason})")
+        fallbacks.inc(kind="local_retrieval")
+        return await asyncio.to_thread(self._search_local, query, filters, hits_per_page or settings.HITS_PER_PAGE)
+
+    async def _asearch_and_store(
+        self,
+        key: str,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        hits_per_page: Optional[int]
+    ) -> Dict[str, Any]:
+        results = await self._asearch(query, filters, hits_per_page)
+        retrieval_cache.set(key, results)
+        return results
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.2, min=0.2, max=2), before_sleep=_count_retry)
+    def _search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        hits_per_page: Optional[int] = None
+    ) -> Dict[str, Any]:
+        if self._use_local():
+            return self._search_local(query, filters, hits_per_page or settings.HITS_PER_PAGE)
+
+        params = self._params(query, filters, hits_per_page)
+        with httpx.Client(timeout=time_left(self.timeout, settings.ALGOLIA_MIN_BUDGET)) as client:
+            r = client.post(self._endpoint(), headers=self._headers(), json={"params": _encode_params(params)})
             r.raise_for_status()
             return r.json()
 
+    # Each attempt queues for admission again; a shed call is not retried, and neither is a
+    # cancelled one (the async retrier sees CancelledError, a BaseException, too)
+    @retry(
+        stop=stop_after_attempt(3) | _out_of_time,
+        retry=retry_if_exception_type(Exception) & retry_if_not_exception_type(Overloaded),
+        wait=wait_exponential(multiplier=0.2, min=0.2, max=2),
+        before_sleep=_count_retry
+    )
+    async def _asearch(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        hits_per_page: Optional[int] = None
+    ) -> Dict[str, Any]:
+        if self._use_local():
+            return await asyncio.to_thread(self._search_local, query, filters, hits_per_page or settings.HITS_PER_PAGE)
+
+        body = {"params": _encode_params(self._params(query, filters, hits_per_page))}
+
+        async def post(url: str) -> Dict[str, Any]:
+            start = time.perf_counter()
+            try:
+                r = await get_async_client().post(url, headers=self._headers(), json=body, timeout=timeout)
+            except asyncio.CancelledError:
+                # A call that lost to its hedge took at least this long; leaving it out would drag the percentile down
+                algolia_latency.observe(time.perf_counter() - start)
+                raise
+            r.raise_for_status()
+            algolia_latency.observe(time.perf_counter() - start)
+            return r.json()
+
+        endpoints = self._endpoints()
+        attempts = [
+            lambda url=endpoints[i % len(endpoints)]: post(url)
+            for i in range(1 + max(0, settings.ALGOLIA_MAX_HEDGES))
+        ]
+        async with algolia_scheduler.slot():
+            # Set once admitted, so time spent queueing counts. Past the deadline with nowhere to fall
+            # back to, a short last try still beats failing outright
+            timeout = time_left(self.timeout, settings.ALGOLIA_MIN_BUDGET)
+            # The slot covers the first call; each hedge needs a free one of its own or is skipped
+            return await hedged(
+                attempts,
+                self._hedge_delay(),
+                on_hedge=lambda: upstream_hedges.inc(upstream="algolia"),
+                admit=algolia_scheduler.try_acquire
+            )
+
     def _search_local(
         self,
         query: str,
         filters: Optional[Dict[str, Any]],
         hits_per_page: int
     ) -> Dict[str, Any]:
-        with open(settings.LOCAL_JSON_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        query_l = query.lower()
-        hits = []
-        for item in data:
-            text = " ".join([
-                str(item.get(k, ""))
-                for k in ["name","title","brand","categories","description","shortDescription"]
-            ]).lower()
-            score = 0
-            for token in query_l.split():
-                if token in text:
-                    score += 1
-            ok = True
-            if filters:
-                bmin = filters.get("budget_min")
-                bmax = filters.get("budget_max")
-                price = item.get("price")
-                if price is not None:
-                    if bmin is not None and price < bmin: ok = False
-                    if bmax is not None and price > bmax: ok = False
-            if ok and score > 0:
-                hits.append({"_highlightResult": {}, **item, "_score": score})
-
-        hits.sort(key=lambda x: x.get("_score", 0), reverse=True)
-        return {"hits": hits[:hits_per_page], "nbHits": len(hits)}
+        return get_catalog_index(settings.LOCAL_JSON_PATH).search(query, filters, hits_per_page)
 
 
 def _encode_params(d: Dict[str, Any]) -> str:
@@ -2,6 +2,8 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Literal, Any
 
+from .config import settings
+
 Role = Literal["user", "assistant", "system"]
 
 
@@ -16,6 +18,20 @@ class RecommendRequest(BaseModel):
     top_n: int = Field(default=5, ge=1, le=20)
     budget_min: Optional[float] = None
     budget_max: Optional[float] = None
+    bypass_cache: bool = Field(default=False, description="Always call the LLM instead of reusing a cached completion.")
+    conversation_id: Optional[str] = Field(default=None, max_length=128, description="Keep conversation state on the server; later turns only send the new message.")
+    deadline_ms: Optional[int] = Field(default=None, ge=100, le=120000, description="Time budget for this request; defaults to REQUEST_DEADLINE.")
+
+
+class BatchRecommendRequest(BaseModel):
+    requests: List[RecommendRequest] = Field(max_length=settings.BATCH_MAX_REQUESTS, description="At most BATCH_MAX_REQUESTS requests.")
+    concurrency: int = Field(default=8, ge=1, le=256, description="Requests processed at the same time.")
+    ordered: bool = Field(default=True, description="Emit results in input order instead of as they complete.")
+
+
+class CatalogDelta(BaseModel):
+    upsert: List[dict] = Field(default=[], description="Items to add or replace, matched by objectID.")
+    delete: List[str] = Field(default=[], description="objectIDs to remove.")
 
 
 class Hit(BaseModel):
@@ -43,4 +59,5 @@ class RecommendResponse(BaseModel):
     recommendations: List[Recommendation]
     clarifying_questions: List[str] = []
     used_fallback_generator: bool = False
+    conversation_id: Optional[str] = None
     debug: Optional[dict[str, Any]] = None
@@ -0,0 +1,183 @@
+import asyncio
+import copy
+import threading
+import uuid
+import weakref
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+
+from .config import settings
+from .cache import CacheBackend, DiskBackend, MemoryBackend
+from .metrics import CallbackGauge
+from .catalog import catalog_generation
+
+# Slots that describe only the turn they came from and are not carried forward
+TURN_SLOTS = ("education_query",)
+# Catalog generations count swaps in this process only, so a stored retrieval is tagged with both
+_WORKER = uuid.uuid4().hex[:12]
+
+
+def _catalog_version() -> str:
+    return f"{_WORKER}:{catalog_generation()}"
+
+
+class Session:
+    """
+    Server-side state of one conversation: merged slots, the last few messages, a rolling
+    summary of older user requests and the last retrieval, so a turn only has to send its new message.
+    """
+
+    def __init__(self, conversation_id: str, lock: Optional[asyncio.Lock] = None):
+        self.id = conversation_id
+        self.slots: Dict[str, Any] = {}
+        self.history: List[Dict[str, str]] = []
+        self.earlier_requests: deque = deque(maxlen=settings.SESSION_SUMMARY_REQUESTS)
+        self.filters: Optional[Dict[str, Any]] = None
+        self.results: Optional[Dict[str, Any]] = None
+        self.results_catalog: Optional[str] = None
+        self.turns = 0
+        # Turns of one conversation run one at a time so each sees the previous turn's state
+        self.lock = lock or asyncio.Lock()
+
+    def state(self) -> Dict[str, Any]:
+        """What the session store keeps: JSON-serializable, without the lock."""
+        return copy.deepcopy({
+            "slots": self.slots,
+            "history": self.history,
+            "earlier_requests": list(self.earlier_requests),
+            "filters": self.filters,
+            "results": self.results,
+            "results_catalog": self.results_catalog,
+            "turns": self.turns
+        })
+
+    def restore(self, state: Dict[str, Any]):
+        state = copy.deepcopy(state)
+        self.slots = state["slots"]
+        self.history = state["history"]
+        self.earlier_requests = deque(state["earlier_requests"], maxlen=settings.SESSION_SUMMARY_REQUESTS)
+        self.filters = state["filters"]
+        self.results = state["results"]
+        self.results_catalog = state["results_catalog"]
+        self.turns = state["turns"]
+
+    def merge_slots(self, slots: Dict[str, Any]) -> Dict[str, Any]:
+        """This turn's slots over the conversation's: new values win, missing ones are kept."""
+        merged = dict(slots)
+        for name, value in self.slots.items():
+            if merged.get(name) is None:
+                merged[name] = value
+        return merged
+
+    def summary(self) -> str:
+        if not self.earlier_requests:
+            return ""
+        return "Earlier in this conversation the user asked: " + " | ".join(self.earlier_requests)
+
+    def context_messages(self, user_text: str) -> List[Dict[str, str]]:
+        """Messages for the prompt: the rolling summary, the recent history and this turn's message."""
+        messages = []
+        summary = self.summary()
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        messages.extend(self.history)
+        messages.append({"role": "user", "content": user_text})
+        return messages
+
+    def reusable_results(self, filters: Dict[str, Any], slots: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The last retrieval when this turn changed neither the filters nor any carried slot, nor the catalog."""
+        if self.results is None or filters != self.filters or self.results_catalog != _catalog_version():
+            return None
+        if any(slots.get(k) != self.slots.get(k) for k in set(slots) | set(self.slots) if k not in TURN_SLOTS):
+            return None
+        return self.results
+
+    def finish_turn(
+        self,
+        user_text: str,
+        reply: str,
+        slots: Dict[str, Any],
+        filters: Dict[str, Any],
+        results: Dict[str, Any]
+    ):
+        self.slots = {k: v for k, v in slots.items() if k not in TURN_SLOTS}
+        self.filters = filters
+        self.results = results
+        self.results_catalog = _catalog_version()
+        self.turns += 1
+        self.history.append({"role": "user", "content": user_text})
+        self.history.append({"role": "assistant", "content": reply})
+        # Messages leaving the window survive as one line per user request in the summary
+        while len(self.history) > settings.SESSION_HISTORY_MESSAGES:
+            message = self.history.pop(0)
+            if message["role"] == "user":
+                self.earlier_requests.append(message["content"][:settings.SESSION_SUMMARY_CHARS])
+
+
+class SessionStore:
+    """
+    Sessions by conversation id, bounded by idle time (TTL) and, in memory, by count (LRU).
+    The backend holds each session's `state()`, so one shared by all workers (SESSION_STORE_PATH,
+    or any CacheBackend) lets any worker serve any turn; the lock only orders turns within a worker.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float], backend: Optional[CacheBackend] = None):
+        self.ttl = ttl
+        self.backend = backend if backend is not None else MemoryBackend(maxsize)
+        # One lock per conversation while any of its sessions is in use
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def get_or_create(self, conversation_id: str) -> Tuple[Session, bool]:
+        """The conversation's session, empty until `load` is called with its lock held."""
+        with self._lock:
+            lock = self._locks.get(conversation_id)
+            if lock is None:
+                lock = self._locks[conversation_id] = asyncio.Lock()
+        session = Session(conversation_id, lock)
+        created = self.backend.get(conversation_id) is None
+        if created:
+            self.save(session)
+            self._created += 1
+            if self._created % 1000 == 0 and isinstance(self.backend, DiskBackend):
+                self.backend.purge_expired()
+        return session, created
+
+    def load(self, session: Session):
+        """Bring `session` up to date with the stored state; call with its lock held."""
+        state = self.backend.get(session.id)
+        if state is not None:
+            session.restore(state)
+
+    def save(self, session: Session):
+        # Every turn restarts the idle timer
+        self.backend.set(session.id, session.state(), self.ttl)
+
+    def delete(self, conversation_id: str):
+        self.backend.delete(conversation_id)
+
+    def clear(self):
+        self.backend.clear()
+
+    def __len__(self) -> int:
+        # Backends that cannot count their entries report none
+        return len(self.backend) if hasattr(self.backend, "__len__") else 0
+
+
+def _session_backend() -> CacheBackend:
+    if settings.SESSION_STORE_PATH:
+        return DiskBackend(settings.SESSION_STORE_PATH)
+    return MemoryBackend(settings.SESSION_MAX)
+
+
+sessions = SessionStore(settings.SESSION_MAX, settings.SESSION_TTL, backend=_session_backend())
+
+
+def set_session_backend(backend: CacheBackend):
+    """Swap the store behind the sessions, e.g. for one shared by all workers."""
+    sessions.backend = backend
+
+
+CallbackGauge("advisor_sessions", "Conversations held in the session store.", "gauge", (),
+              lambda: [((), len(sessions))])
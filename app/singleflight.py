@@ -0,0 +1,46 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller starts the work, later
+    callers await the same task. The result, or the exception, is delivered to every waiter.
+    The shared task is shielded, so a waiter timing out or disconnecting never cancels it
+    for the others.
+    """
+
+    def __init__(self, name: str, timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """Run `fn()` unless a call for `key` is already in flight; wait at most `timeout` seconds."""
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+            logger.debug(f"{self.name}: joined in-flight call for {key}")
+
+        timeout = self.timeout if timeout is None else timeout
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved; waiters that are still around re-raise it themselves
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
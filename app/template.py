@@ -0,0 +1,108 @@
+from typing import List, Dict, Any, Optional, Tuple
+
+from .config import settings
+from .intent import propose_questions
+
+# Slots that say what the user wants; a request with none of them is answered with questions
+PREFERENCE_SLOTS = ("device_type", "os", "use_case", "ram", "camera", "weight", "budget_min", "budget_max")
+
+
+def _number(value: Any) -> Optional[float]:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _reasons(hit: Dict[str, Any], slots: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """Why a hit was picked, from the rerank score parts first and then its notable attributes."""
+    parts = hit.get("_advisorScoreParts") or {}
+    reasons, citations = [], []
+
+    def cite(reason: str, attribute: str):
+        reasons.append(reason)
+        value = hit.get(attribute)
+        if value is not None:
+            citation = f"{attribute}: {', '.join(map(str, value)) if isinstance(value, list) else value}"
+            if citation not in citations:
+                citations.append(citation)
+
+    if "device_type" in parts:
+        cite(f"A {slots['device_type']}, as you asked", "categories")
+    if "os" in parts:
+        cite(f"Runs {hit.get('os') or slots['os']}, your preferred OS", "os")
+    if "portability" in parts:
+        cite("Thin and light enough to carry around", "title" if hit.get("title") else "name")
+    if "ram" in parts:
+        cite(f"{hit['ram']}GB of RAM, plenty for programming", "ram")
+    elif _number(hit.get("ram")):
+        cite(f"RAM: {hit['ram']}GB", "ram")
+    if "camera" in parts:
+        cite(f"Camera built for video and social media: {hit.get('camera')}", "camera")
+    elif hit.get("camera"):
+        cite(f"Camera: {hit['camera']}", "camera")
+
+    price = _number(hit.get("price"))
+    bmin, bmax = slots.get("budget_min"), slots.get("budget_max")
+    if price is not None and (bmin is not None or bmax is not None):
+        if "budget_max" in parts:
+            cite(f"${price - bmax:,.2f} over your ${bmax:,.0f} budget", "price")
+        elif "budget_min" in parts:
+            cite(f"Below your ${bmin:,.0f} minimum", "price")
+        else:
+            cite(f"${price:,.2f}, within your budget", "price")
+    return reasons, citations
+
+
+def template_response(
+    user_text: str,
+    slots: Dict[str, Any],
+    top_hits: List[Dict[str, Any]],
+    fallback: bool = True
+) -> Tuple[Dict[str, Any], bool, str]:
+    """
+    Recommendations straight from the reranked hits with no LLM call; same shape as `agenerate`.
+    `fallback` is what the tuple reports as used_fallback: True when this stands in for a failed or
+    out-of-time LLM call, False when the policy chose it.
+    """
+    recommendations = []
+    for hit in top_hits[:settings.RETURN_TOP_N]:
+        reasons, citations = _reasons(hit, slots)
+        recommendations.append({
+            "title": hit.get("title") or hit.get("name") or "Unknown Product",
+            "price": hit.get("price"),
+            "url": hit.get("url"),
+            "score": hit.get("_advisorScore", 0.0),
+            "reasons": reasons,
+            "citations": citations
+        })
+    questions = propose_questions(slots)
+    gen_out = {"recommendations": recommendations, "clarifying_questions": questions, "generator": "template"}
+
+    if recommendations:
+        conv = f"Here are the closest matches I found for '{user_text}':\n"
+        for rec in recommendations:
+            price = rec["price"] if rec["price"] is not None else "N/A"
+            conv += f"- {rec['title']} (${price})" + (f": {'; '.join(rec['reasons'])}" if rec["reasons"] else "") + "\n"
+    else:
+        conv = f"I couldn't find devices matching '{user_text}'.\n"
+    if questions:
+        conv += "To narrow it down: " + " ".join(questions[:3])
+    return gen_out, fallback, conv.strip()
+
+
+def template_reason(slots: Dict[str, Any], top_hits: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Why GENERATOR_MODE lets the template answer instead of the LLM, or None to call the LLM.
+    "auto" uses it when the user stated no preference yet (the reply is mostly clarifying questions),
+    or when the first TEMPLATE_MIN_HITS reranked hits all score at least TEMPLATE_MIN_SCORE;
+    questions like "what is RAM?" always go to the LLM.
+    """
+    mode = settings.GENERATOR_MODE
+    if mode == "template":
+        return "mode"
+    if mode != "auto" or slots.get("education_query"):
+        return None
+    if all(slots.get(name) is None for name in PREFERENCE_SLOTS):
+        return "missing_slots"
+    confident = top_hits[:settings.TEMPLATE_MIN_HITS]
+    if len(confident) == settings.TEMPLATE_MIN_HITS and all(h.get("_advisorScore", 0.0) >= settings.TEMPLATE_MIN_SCORE for h in confident):
+        return "confident"
+    return None
@@ -0,0 +1,22 @@
+import numpy as np
+
+
+def top_k_desc(scores: np.ndarray, k: int, candidates: np.ndarray = None) -> np.ndarray:
+    """
+    Indices of the `k` highest scores, highest first and lowest index first among ties
+    (the order a stable descending sort would give), without sorting the whole array.
+    `candidates` optionally restricts the selection to those indices.
+    """
+    if candidates is None:
+        candidates = np.arange(len(scores))
+    if k <= 0 or len(candidates) == 0:
+        return candidates[:0]
+    vals = scores[candidates]
+    if len(candidates) > k:
+        # argpartition picks an arbitrary subset of the ties at the cut-off, so keep every
+        # candidate at or above the k-th score and settle the order with a lexsort
+        kth = vals[np.argpartition(-vals, k - 1)[k - 1]]
+        keep = vals >= kth
+        candidates, vals = candidates[keep], vals[keep]
+    order = np.lexsort((candidates, -vals))
+    return candidates[order[:k]]
@@ -0,0 +1,124 @@
+"""
+Startup phases of a worker, so new workers take traffic quickly and only once they are warm.
+
+1. Import: app.main loads what serving a request needs and no more. The OpenAI SDK, scipy,
+   scikit-learn and tiktoken load on first use; `python -m bench.startup` checks the import budget.
+2. Warm-up, in the background once the server is up: the local catalog index with the delta
+   files applied (and the BM25 or dense structures LOCAL_SEARCH_MODE uses), the intent keyword
+   tables, the prompt tokenizer and the OpenAI SDK, then one request each to Algolia and OpenAI to open their connection pools.
+3. Ready: /ready answers 200 from then on, and 503 before and once shutdown starts. /health
+   only says the process is up.
+
+A failed step is logged and listed in /ready. The worker still becomes ready, because every
+upstream has a fallback.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+from .metrics import CallbackGauge
+
+logger = logging.getLogger(__name__)
+
+_state: Dict[str, Any] = {"ready": False, "stopping": False, "steps": {}, "errors": {}}
+_task: Optional[asyncio.Task] = None
+
+CallbackGauge("advisor_ready", "1 once the worker is warm and ready for traffic.", "gauge", (),
+              lambda: [((), 1.0 if is_ready() else 0.0)])
+
+
+def serves_local_catalog() -> bool:
+    # The local catalog is the backend, or Algolia's fallback when there is one on disk
+    return settings.USE_LOCAL_JSON or (settings.RETRIEVAL_FALLBACK_LOCAL and os.path.exists(settings.LOCAL_JSON_PATH))
+
+
+def _catalog():
+    # Built by the reloader, so the delta files are applied before /ready and later checks
+    # compare the files on disk with what this index was built from
+    from .reload import get_reloader
+    get_reloader().reload().result()
+
+
+def _intent():
+    from .intent import extract_slots
+    extract_slots("a light laptop under $1000 with 16gb ram")
+
+
+def _llm_client():
+    from .generator import get_async_client
+    from .prompt import count_tokens
+    count_tokens("warm up")
+    get_async_client()
+
+
+async def _algolia():
+    from .retriever import open_connection
+    await open_connection(settings.WARMUP_TIMEOUT)
+
+
+async def _openai():
+    from .generator import open_connection
+    await open_connection(settings.WARMUP_TIMEOUT)
+
+
+def steps() -> List[Tuple[str, Callable[[], Any]]]:
+    """Warm-up steps for this configuration, in order; sync steps run on a worker thread."""
+    planned: List[Tuple[str, Callable[[], Any]]] = []
+    if serves_local_catalog():
+        planned.append(("catalog", _catalog))
+    planned.append(("intent", _intent))
+    uses_llm = settings.GENERATOR_MODE != "template" and settings.OPENAI_API_KEY
+    if uses_llm:
+        planned.append(("llm_client", _llm_client))
+    if not settings.USE_LOCAL_JSON and settings.ALGOLIA_APP_ID and settings.ALGOLIA_API_KEY:
+        planned.append(("algolia", _algolia))
+    if uses_llm:
+        planned.append(("openai", _openai))
+    return planned
+
+
+async def warm_up() -> Dict[str, Any]:
+    start = time.perf_counter()
+    for name, step in steps():
+        t = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(step):
+                await asyncio.wait_for(step(), settings.WARMUP_TIMEOUT)
+            else:
+                await asyncio.to_thread(step)
+        except Exception as e:
+            _state["errors"][name] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            logger.warning(f"Warm-up step {name} failed ({_state['errors'][name]}); continuing")
+        _state["steps"][name] = round((time.perf_counter() - t) * 1000, 1)
+    _state["ready"] = True
+    logger.info(f"Worker ready in {time.perf_counter() - start:.2f}s: {_state['steps']}")
+    return state()
+
+
+def start_warm_up() -> asyncio.Task:
+    global _task
+    _task = asyncio.ensure_future(warm_up())
+    return _task
+
+
+def stop():
+    """Shutdown has started: stop taking traffic."""
+    _state["stopping"] = True
+    if _task is not None and not _task.done():
+        _task.cancel()
+
+
+def is_ready() -> bool:
+    return _state["ready"] and not _state["stopping"]
+
+
+def state() -> Dict[str, Any]:
+    status = "stopping" if _state["stopping"] else "ready" if _state["ready"] else "warming_up"
+    return {
+        "status": status,
+        "steps_ms": dict(_state["steps"]),
+        "errors": dict(_state["errors"])
+    }
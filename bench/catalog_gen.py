@@ -0,0 +1,79 @@
+"""
+Synthetic BestBuy-style catalog for benchmarks.
+
+    python -m bench.catalog_gen --size 100k -o data/synth_100k.json
+"""
+import argparse
+import json
+import random
+from typing import Any, Dict, Iterator
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+BRANDS = ["Apple", "Dell", "HP", "Lenovo", "Samsung", "Google", "Asus", "Acer", "Microsoft", "Motorola", "OnePlus", "Razer"]
+# Categories include the device type itself, the value the app's `device_type` filter asks for
+DEVICES = [
+    ("laptop", ["laptop", "Laptops", "Computers & Tablets"], ["Windows", "Apple", "ChromeOS"]),
+    ("phone", ["phone", "Cell Phones", "Unlocked Phones"], ["Apple", "Android"]),
+    ("tablet", ["tablet", "Tablets", "Computers & Tablets"], ["Apple", "Android", "Windows"]),
+]
+ADJECTIVES = ["thin", "light", "air", "ultrabook", "pro", "gaming", "creator", "business", "compact", "flagship", "budget", "plus"]
+FEATURES = [
+    "all-day battery", "OLED display", "fast SSD storage", "backlit keyboard", "4K video recording",
+    "optical image stabilization (OIS)", "HDR photos", "stereo speakers", "fingerprint reader",
+    "Wi-Fi 6E", "Thunderbolt ports", "120Hz refresh rate", "1080p webcam", "pro camera system",
+]
+CAMERAS = ["12MP", "48MP with OIS", "50MP HDR", "4K video with stabilization", "1080p webcam", "108MP pro camera"]
+
+
+def generate_items(n: int, seed: int = 0, description_words: int = 30) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(n):
+        device, categories, oses = rng.choice(DEVICES)
+        brand = rng.choice(BRANDS)
+        name = f"{brand} {rng.choice(ADJECTIVES).title()} {device.title()} {rng.randint(1, 99)}"
+        features = rng.sample(FEATURES, 4)
+        words = " ".join(rng.choice(FEATURES) for _ in range(max(1, description_words // 3)))
+        yield {
+            "objectID": str(i),
+            "name": name,
+            "brand": brand,
+            "categories": categories,
+            "price": round(rng.uniform(79, 3499), 2),
+            "os": rng.choice(oses),
+            "ram": rng.choice([4, 8, 12, 16, 32, 64]),
+            "storage": rng.choice(["64GB", "128GB", "256GB", "512GB", "1TB"]),
+            "camera": rng.choice(CAMERAS),
+            "rating": round(rng.uniform(2.5, 5.0), 1),
+            "url": f"https://example.com/p/{i}",
+            "image": f"https://example.com/img/{i}.jpg",
+            "shortDescription": f"{name} with {features[0]} and {features[1]}.",
+            "description": f"{name}: {', '.join(features)}. {words}",
+        }
+
+
+def write_catalog(path: str, n: int, seed: int = 0, description_words: int = 30):
+    # Streamed so the 1M-item catalog never has to sit in memory as one list
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, item in enumerate(generate_items(n, seed, description_words)):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(item))
+        f.write("]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic catalog JSON file.")
+    parser.add_argument("--size", default="1k", help="1k, 100k, 1m or an item count")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--description-words", type=int, default=30)
+    args = parser.parse_args()
+    n = SIZES.get(args.size.lower()) or int(args.size)
+    write_catalog(args.output, n, args.seed, args.description_words)
+    print(f"wrote {n} items to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Check admission control's slot accounting: Scheduler with hedged calls under load, cancellation,
+priorities and deadline shedding, and that a cancelled Algolia search is not retried.
+
+    python -m bench.check_admission
+    python -m bench.check_admission --calls 2000 --concurrency 8
+"""
+import argparse
+import asyncio
+import random
+import sys
+from typing import Callable, List
+
+from app.admission import BATCH, INTERACTIVE, Overloaded, Scheduler
+from app.deadline import hedged, start_deadline
+
+
+class Upstream:
+    """Fake upstream that records how many calls are in flight at once."""
+
+    def __init__(self, rng: random.Random, slow_fraction: float = 0.5):
+        self.rng = rng
+        self.slow_fraction = slow_fraction
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def call(self, fail: bool = False):
+        self.active += 1
+        self.calls += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.05 if self.rng.random() < self.slow_fraction else 0.002)
+            if fail:
+                raise RuntimeError("upstream error")
+            return "ok"
+        finally:
+            self.active -= 1
+
+
+async def hedged_call(scheduler: Scheduler, attempts: List[Callable], hedges: List[int], delay: float = 0.01):
+    # The same shape as AlgoliaRetriever._asearch: one queued slot, and a free one per hedge
+    async with scheduler.slot():
+        return await hedged(attempts, delay, on_hedge=lambda: hedges.append(1), admit=scheduler.try_acquire)
+
+
+async def settle():
+    # Released slots of cancelled hedges come back from their tasks' done callbacks
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+def idle(scheduler: Scheduler) -> bool:
+    return scheduler.in_flight == 0 and not any(scheduler.depth.values())
+
+
+async def check_load(rng: random.Random, calls: int, concurrency: int) -> List[str]:
+    scheduler = Scheduler("check_load", concurrency, max_queue=calls)
+    upstream = Upstream(rng)
+    hedges: List[int] = []
+    results = await asyncio.gather(*[
+        hedged_call(scheduler, [upstream.call] * 3, hedges) for _ in range(calls)
+    ], return_exceptions=True)
+    await settle()
+    problems = []
+    if upstream.peak > concurrency:
+        problems.append(f"{upstream.peak} calls in flight with a limit of {concurrency}")
+    if not idle(scheduler):
+        problems.append(f"slots left held: in_flight {scheduler.in_flight}, queued {scheduler.depth}")
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        problems.append(f"{len(errors)} calls failed, e.g. {errors[0]!r}")
+    print(f"  load: {calls} hedged calls, limit {concurrency}: peak {upstream.peak} in flight, {len(hedges)} hedges sent")
+    return problems
+
+
+async def check_idle_hedges(rng: random.Random) -> List[str]:
+    scheduler = Scheduler("check_idle", 8)
+    upstream = Upstream(rng, slow_fraction=1.0)
+    hedges: List[int] = []
+    await hedged_call(scheduler, [upstream.call] * 3, hedges)
+    await settle()
+    problems = []
+    if not hedges:
+        problems.append("no hedge sent with free slots")
+    if not idle(scheduler):
+        problems.append(f"slots left held after hedging: in_flight {scheduler.in_flight}")
+    return problems
+
+
+async def check_failover(rng: random.Random) -> List[str]:
+    scheduler = Scheduler("check_failover", 2)
+    upstream = Upstream(rng, slow_fraction=0.0)
+    result = await hedged_call(scheduler, [lambda: upstream.call(fail=True), upstream.call, upstream.call], [])
+    await settle()
+    problems = []
+    if result != "ok":
+        problems.append(f"failover returned {result!r}")
+    if not idle(scheduler):
+        problems.append(f"slots left held after failover: in_flight {scheduler.in_flight}")
+    return problems
+
+
+async def check_cancel() -> List[str]:
+    scheduler = Scheduler("check_cancel", 4)
+    slow = [lambda: asyncio.sleep(10)] * 3
+    tasks = [asyncio.ensure_future(hedged_call(scheduler, slow, [])) for _ in range(6)]
+    await asyncio.sleep(0.05)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await settle()
+    if not idle(scheduler):
+        return [f"slots left held after cancelling: in_flight {scheduler.in_flight}, queued {scheduler.depth}"]
+    return []
+
+
+async def check_priority() -> List[str]:
+    scheduler = Scheduler("check_priority", 1)
+    order: List[str] = []
+    gate = asyncio.Event()
+
+    async def call(name: str, priority: int):
+        async with scheduler.slot(priority):
+            order.append(name)
+            if name == "first":
+                await gate.wait()
+
+    first = asyncio.ensure_future(call("first", INTERACTIVE))
+    await asyncio.sleep(0)
+    waiting = [asyncio.ensure_future(call(f"batch{i}", BATCH)) for i in range(2)]
+    waiting.append(asyncio.ensure_future(call("interactive", INTERACTIVE)))
+    await asyncio.sleep(0.01)
+    gate.set()
+    await asyncio.gather(first, *waiting)
+    if order != ["first", "interactive", "batch0", "batch1"]:
+        return [f"admission order {order}"]
+    return []
+
+
+async def check_deadline_shed() -> List[str]:
+    scheduler = Scheduler("check_shed", 1)
+    # Teach the scheduler that a call holds its slot for about 0.2s
+    async with scheduler.slot():
+        await asyncio.sleep(0.2)
+
+    async def holder():
+        async with scheduler.slot():
+            await asyncio.sleep(0.3)
+
+    async def with_deadline():
+        start_deadline(0.05)
+        async with scheduler.slot():
+            pass
+
+    hold = asyncio.ensure_future(holder())
+    await asyncio.sleep(0)
+    problems = []
+    try:
+        await with_deadline()
+        problems.append("a call that cannot start before its deadline was admitted")
+    except Overloaded as e:
+        if e.reason != "deadline" or e.status != 503:
+            problems.append(f"shed with {e.reason}/{e.status}, expected deadline/503")
+    await hold
+    if not idle(scheduler):
+        problems.append(f"slots left held after shedding: in_flight {scheduler.in_flight}")
+    return problems
+
+
+async def check_search_cancel() -> List[str]:
+    from app import retriever
+    from app.config import settings
+    saved = (settings.USE_LOCAL_JSON, settings.ALGOLIA_APP_ID, settings.ALGOLIA_API_KEY, retriever.get_async_client)
+    posts = 0
+
+    class Hanging:
+        async def post(self, *args, **kwargs):
+            nonlocal posts
+            posts += 1
+            await asyncio.sleep(10)
+
+    settings.USE_LOCAL_JSON, settings.ALGOLIA_APP_ID, settings.ALGOLIA_API_KEY = False, "check", "check"
+    retriever.get_async_client = lambda: Hanging()
+    try:
+        task = asyncio.ensure_future(retriever.AlgoliaRetriever()._asearch("laptop"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await asyncio.wait_for(task, 5)
+            return ["a cancelled search returned"]
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            return [f"a cancelled search ended with {type(e).__name__} after {posts} posts instead of being cancelled"]
+        await settle()
+        problems = []
+        if posts != 1:
+            problems.append(f"a cancelled search posted {posts} times")
+        if not idle(retriever.algolia_scheduler):
+            problems.append(f"Algolia slots left held: in_flight {retriever.algolia_scheduler.in_flight}")
+        return problems
+    finally:
+        settings.USE_LOCAL_JSON, settings.ALGOLIA_APP_ID, settings.ALGOLIA_API_KEY, retriever.get_async_client = saved
+
+
+async def run(args) -> int:
+    rng = random.Random(args.seed)
+    checks = [
+        ("hedged calls under load", lambda: check_load(rng, args.calls, args.concurrency)),
+        ("hedges with free slots", lambda: check_idle_hedges(rng)),
+        ("failover after an error", lambda: check_failover(rng)),
+        ("cancelled hedged calls", check_cancel),
+        ("interactive before batch", check_priority),
+        ("deadline shedding", check_deadline_shed),
+        ("cancelled Algolia search", check_search_cancel),
+    ]
+    failures = 0
+    for name, check in checks:
+        problems = await check()
+        print(f"{'FAIL' if problems else 'ok  '} {name}" + "".join(f"\n  {p}" for p in problems))
+        failures += bool(problems)
+    print(f"{len(checks) - failures}/{len(checks)} admission checks pass")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check admission control's slot accounting.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(run(args)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Check slot extraction against the golden set recorded from the original hand-written rules.
+
+    python -m bench.check_intent_golden
+    python -m bench.check_intent_golden --keywords my_keywords.json
+"""
+import argparse
+import json
+import os
+import sys
+
+from app.intent import SlotExtractor, get_extractor
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "data", "intent_golden.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare extract_slots output with the golden set.")
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    parser.add_argument("--keywords", help="keyword tables to check instead of the configured ones")
+    args = parser.parse_args()
+
+    with open(args.golden, "r", encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    extractor = SlotExtractor.from_file(args.keywords) if args.keywords else get_extractor()
+
+    failures = 0
+    batch = extractor.extract_batch([c["text"] for c in cases])
+    for case, batched in zip(cases, batch):
+        single = extractor.extract(case["text"])
+        if single != case["slots"] or batched != case["slots"]:
+            failures += 1
+            print(f"MISMATCH {case['text']!r}\n  expected {case['slots']}\n  got      {single}")
+    print(f"{len(cases) - failures}/{len(cases)} golden cases match")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Check that the vectorized reranker matches score_hit and the Python rerank exactly, on random
+hit lists and slots: every score bit for bit, and the same hits in the same order.
+
+    python -m bench.check_rerank
+    python -m bench.check_rerank --trials 2000 --seed 7
+"""
+import argparse
+import random
+import sys
+from typing import Any, Dict, List
+
+from app.ranker import HitFeatures, rerank_vectorized, score_hit
+
+from .catalog_gen import generate_items
+
+
+def random_hit(rng: random.Random, item: Dict[str, Any]) -> Dict[str, Any]:
+    """A catalog item with the odd shapes real hits have: either relevance signal, or neither,
+    non-numeric ram, a bare-string category, a missing or unusual title, no price."""
+    hit = dict(item)
+    r = rng.random()
+    if r < 0.4:
+        hit["_rankingInfo"] = {"nbExactWords": rng.randint(0, 4), "typo": rng.randint(0, 2)}
+    elif r < 0.8:
+        hit["_score"] = rng.choice([0, 0.5, 1, 2, 3, 7.3, 12])
+    if rng.random() < 0.1:
+        hit["ram"] = rng.choice(["16GB", 16.0, True, None])
+    if rng.random() < 0.05:
+        hit["categories"] = "laptop"
+    if rng.random() < 0.1:
+        hit["title"] = rng.choice(["iPhone 15 pro", "Thin Air", "Android X", None])
+    if rng.random() < 0.05:
+        hit.pop("camera", None)
+    if rng.random() < 0.05:
+        hit["price"] = None
+    return hit
+
+
+def random_slots(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "device_type": rng.choice([None, "laptop", "phone", "tablet"]),
+        "os": rng.choice([None, "Windows", "Apple", "Android", "ChromeOS"]),
+        "use_case": rng.choice([None, "programming", "social_media", "gaming"]),
+        "budget_min": rng.choice([None, 300.0, 500]),
+        "budget_max": rng.choice([None, 1000.0, 1500]),
+    }
+
+
+def check(hits: List[Dict[str, Any]], slots: Dict[str, Any], top_k: int) -> List[str]:
+    problems = []
+    expected = [score_hit(dict(h), slots, "") for h in hits]
+    got = HitFeatures([dict(h) for h in hits]).scores(slots).tolist()
+    if expected != got:
+        i = next(i for i, (a, b) in enumerate(zip(expected, got)) if a != b)
+        problems.append(f"score of hit {i}: score_hit {expected[i]!r}, vectorized {got[i]!r}")
+
+    # The Python rerank's order: a stable sort by score, descending
+    order = sorted(range(len(hits)), key=lambda i: expected[i], reverse=True)[:top_k]
+    copies = [dict(h) for h in hits]
+    rows = {id(h): i for i, h in enumerate(copies)}
+    reranked = rerank_vectorized(copies, slots, "", top_k)
+    if [rows[id(h)] for h in reranked] != order:
+        problems.append(f"top {top_k} order: expected {order}, got {[rows[id(h)] for h in reranked]}")
+    elif [h["_advisorScore"] for h in reranked] != [expected[i] for i in order]:
+        problems.append(f"top {top_k} _advisorScore differs")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the vectorized reranker with score_hit on random hits.")
+    parser.add_argument("--trials", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-hits", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    items = list(generate_items(500, seed=args.seed))
+    failures = pairs = 0
+    for trial in range(args.trials):
+        hits = [random_hit(rng, rng.choice(items)) for _ in range(rng.randint(0, args.max_hits))]
+        slots = random_slots(rng)
+        pairs += len(hits)
+        problems = check(hits, slots, rng.randint(0, 40))
+        if problems:
+            failures += 1
+            print(f"MISMATCH trial {trial} slots {slots}\n  " + "\n  ".join(problems))
+    print(f"{args.trials - failures}/{args.trials} trials match ({pairs} hit/slot pairs, seed {args.seed})")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Local stand-in for the Algolia query API with configurable latency and payload size.
+
+    python -m bench.fake_algolia --port 8101 --latency-ms 40 --jitter-ms 10
+    python -m bench.fake_algolia --port 8101 --latency-ms 40 --slow-fraction 0.05 --slow-ms 1000   # heavy tail
+    ALGOLIA_HOST=http://127.0.0.1:8101 ALGOLIA_APP_ID=bench ALGOLIA_API_KEY=bench uvicorn app.main:app
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from .catalog_gen import generate_items
+
+
+def make_handler(pool, latency_ms: float, jitter_ms: float, nb_hits: int, slow_fraction: float = 0.0, slow_ms: float = 0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                params = parse_qs(json.loads(body).get("params", ""))
+                hits_per_page = int(params.get("hitsPerPage", ["20"])[0])
+            except (ValueError, AttributeError):
+                hits_per_page = 20
+            delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms))
+            if random.random() < slow_fraction:
+                delay += slow_ms
+            time.sleep(delay / 1000)
+
+            hits = []
+            for item in random.sample(pool, min(hits_per_page, len(pool))):
+                hits.append({**item, "_rankingInfo": {"nbExactWords": random.randint(0, 3), "typo": random.randint(0, 1)}})
+            payload = json.dumps({"hits": hits, "nbHits": nb_hits, "hitsPerPage": hits_per_page}).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            # /1/isalive, which workers call at warm-up
+            payload = json.dumps({"message": "server is alive"}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 8101, latency_ms: float = 40.0, jitter_ms: float = 0.0, pool_size: int = 500,
+          description_words: int = 30, nb_hits: int = 1000, background: bool = False,
+          slow_fraction: float = 0.0, slow_ms: float = 0.0) -> ThreadingHTTPServer:
+    pool = list(generate_items(pool_size, seed=1, description_words=description_words))
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(pool, latency_ms, jitter_ms, nb_hits, slow_fraction, slow_ms))
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Algolia search server")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--pool-size", type=int, default=500, help="Distinct items hits are sampled from")
+    parser.add_argument("--description-words", type=int, default=30, help="Controls the payload size per hit")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Share of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    serve(args.port, args.latency_ms, args.jitter_ms, args.pool_size, args.description_words,
+          slow_fraction=args.slow_fraction, slow_ms=args.slow_ms)
+
+
+if __name__ == "__main__":
+    main()
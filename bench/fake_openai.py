@@ -0,0 +1,142 @@
+"""
+Local stand-in for the OpenAI chat-completions API, streaming and non-streaming, with
+configurable time-to-first-token, token rate and completion size. With --max-concurrency it answers
+429 to calls beyond that many in flight, like a provider's rate limit.
+
+    python -m bench.fake_openai --port 8102 --ttft-ms 300 --tokens-per-s 80
+    OPENAI_BASE_URL=http://127.0.0.1:8102/v1 OPENAI_API_KEY=bench uvicorn app.main:app
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_completion(n_recommendations: int, text_words: int) -> str:
+    recs = [
+        {
+            "title": f"Bench Device {i}",
+            "price": 499.0 + i,
+            "url": f"https://example.com/p/{i}",
+            "reasons": ["High RAM: 16GB", "Lightweight build"],
+            "citations": ["ram: 16", "weight: 1.2kg"],
+        }
+        for i in range(n_recommendations)
+    ]
+    block = json.dumps({"recommendations": recs, "clarifying_questions": ["Do you have a target budget range?"]}, indent=2)
+    text = " ".join(["These picks match what you asked for."] + ["word"] * text_words)
+    return f"```json\n{block}\n```\n---\n{text}"
+
+
+def make_handler(completion: str, ttft_ms: float, tokens_per_s: float, chunk_chars: int, max_concurrency: int = 0):
+    chunks = [completion[i:i + chunk_chars] for i in range(0, len(completion), chunk_chars)]
+    # Treat one chunk as one token for pacing
+    token_delay = 1.0 / tokens_per_s if tokens_per_s > 0 else 0.0
+    in_flight = [0]
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with lock:
+                limited = max_concurrency > 0 and in_flight[0] >= max_concurrency
+                if not limited:
+                    in_flight[0] += 1
+            if limited:
+                payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}).encode("utf-8")
+                self.send_response(429)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("Retry-After", "1")
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            try:
+                self._complete(body)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+        def _complete(self, body):
+            model = body.get("model", "gpt-4o-mini")
+            created = int(time.time())
+            time.sleep(ttft_ms / 1000)
+
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for piece in chunks:
+                    event = {
+                        "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                    }
+                    self._chunk(f"data: {json.dumps(event)}\n\n")
+                    time.sleep(token_delay)
+                self._chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                return
+
+            time.sleep(token_delay * len(chunks))
+            payload = json.dumps({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": completion}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(chunks), "total_tokens": len(chunks)},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            # /v1/models, which workers call at warm-up
+            payload = json.dumps({"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "created": 0, "owned_by": "bench"}]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _chunk(self, text: str):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 8102, ttft_ms: float = 300.0, tokens_per_s: float = 0.0, n_recommendations: int = 5,
+          text_words: int = 80, chunk_chars: int = 16, background: bool = False,
+          max_concurrency: int = 0) -> ThreadingHTTPServer:
+    completion = make_completion(n_recommendations, text_words)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(completion, ttft_ms, tokens_per_s, chunk_chars, max_concurrency))
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat-completions server")
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Delay before the first token")
+    parser.add_argument("--tokens-per-s", type=float, default=0.0, help="0 sends the rest immediately")
+    parser.add_argument("--recommendations", type=int, default=5)
+    parser.add_argument("--text-words", type=int, default=80)
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Answer 429 beyond this many calls in flight (0: no limit)")
+    args = parser.parse_args()
+    serve(args.port, args.ttft_ms, args.tokens_per_s, args.recommendations, args.text_words, max_concurrency=args.max_concurrency)
+
+
+if __name__ == "__main__":
+    main()
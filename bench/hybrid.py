@@ -0,0 +1,138 @@
+"""
+Recall and latency of the hybrid (token + hashed n-gram embedding) local search.
+
+    python -m bench.hybrid --size 100k
+    python -m app.compact data/synth_1m.json -o data/synth_1m.catalog --embeddings
+    python -m bench.hybrid --catalog data/synth_1m.catalog
+
+Paraphrase precision: each query rewords one of the catalog's feature phrases (plurals, synonyms,
+typos); a hit is relevant when its text contains the original phrase. Quantization recall: overlap of
+the int8 top-k with the float32 top-k over the same vectors.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from .catalog_gen import SIZES, write_catalog
+from .stats import summarize, format_row
+
+# (phrase as it appears in the catalog, how a user might put it)
+PARAPHRASES = [
+    ("all-day battery", "battery that lasts all day"),
+    ("oled display", "oled screens"),
+    ("fast ssd storage", "quick ssd drive"),
+    ("backlit keyboard", "keyboard with backlight"),
+    ("backlit keyboard", "backlite keybord"),
+    ("4k video recording", "records 4k videos"),
+    ("optical image stabilization", "image stabilisation for shaky video"),
+    ("hdr photos", "hdr photography"),
+    ("stereo speakers", "stereo speeker sound"),
+    ("fingerprint reader", "fingerprint sensor"),
+    ("wi-fi 6e", "wifi 6e"),
+    ("thunderbolt ports", "thunderbolt port"),
+    ("120hz refresh rate", "120 hz refreshing screen"),
+    ("1080p webcam", "1080p web cam for calls"),
+    ("pro camera system", "professional camera"),
+]
+
+
+def precision(index, query: str, phrase: str, k: int, mode: str) -> float:
+    hits = index.search(query, None, k, mode=mode)["hits"]
+    if not hits:
+        return 0.0
+    from app.catalog import item_text
+    return sum(phrase in item_text(h) for h in hits) / len(hits)
+
+
+def quantization_recall(index, queries: List[str], k: int) -> float:
+    """Top-k overlap between int8 scores and exact float32 scores of the same embeddings."""
+    from scipy import sparse
+    from app.embeddings import term_matrix, item_idf, CHUNK_ROWS
+    dense = index.dense
+    vocab = index._vocab_blob.split("\n")
+    weights = term_matrix(vocab, dense.dim, item_idf(index._postings_ptr, len(index)))
+    incidence = sparse.csc_matrix(
+        (np.ones(len(index._postings_ids), dtype=np.float32), index._postings_ids, index._postings_ptr),
+        shape=(len(index), len(vocab))
+    ).tocsr()
+    q = dense.embed(queries)
+    exact = np.empty((len(index), len(queries)), dtype=np.float32)
+    for lo in range(0, len(index), CHUNK_ROWS):
+        block = (incidence[lo:lo + CHUNK_ROWS] @ weights).toarray()
+        block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        exact[lo:lo + len(block)] = block @ q.T
+    approx = dense.scores(q)
+    overlaps = []
+    for j in range(len(queries)):
+        top_exact = set(np.argpartition(-exact[:, j], k)[:k])
+        top_approx = set(np.argpartition(-approx[:, j], k)[:k])
+        overlaps.append(len(top_exact & top_approx) / k)
+    return float(np.mean(overlaps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hybrid local search")
+    parser.add_argument("--catalog", help="Catalog JSON or compact directory; generated with --size when omitted")
+    parser.add_argument("--size", default="100k", help="Synthetic catalog size: 1k, 100k, 1m or a count")
+    parser.add_argument("--k", type=int, default=24)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=16, help="Queries per batched dense product")
+    args = parser.parse_args()
+
+    path = args.catalog
+    if not path:
+        n = SIZES.get(args.size.lower()) or int(args.size)
+        path = os.path.join(tempfile.gettempdir(), f"bench_catalog_{n}.json")
+        if not os.path.exists(path):
+            write_catalog(path, n)
+
+    from app.catalog import build_index
+    t = time.perf_counter()
+    index = build_index(path)
+    print(f"{'catalog load + token index':<32} {len(index)} items in {time.perf_counter() - t:.2f}s")
+    t = time.perf_counter()
+    dense = index.dense
+    print(f"{'dense index':<32} {dense.vectors.shape[0]}x{dense.dim} int8 "
+          f"({dense.vectors.nbytes / 2**20:.0f}MB) ready in {time.perf_counter() - t:.2f}s")
+
+    print(f"\nparaphrase precision@{args.k}")
+    print(f"{'query':<40} {'token':>6} {'bm25':>6} {'hybrid':>6}")
+    totals = {"token": [], "bm25": [], "hybrid": []}
+    for phrase, query in PARAPHRASES:
+        row = {mode: precision(index, query, phrase, args.k, mode) for mode in totals}
+        for mode, value in row.items():
+            totals[mode].append(value)
+        print(f"{query:<40} {row['token']:>6.2f} {row['bm25']:>6.2f} {row['hybrid']:>6.2f}")
+    print(f"{'mean':<40} " + " ".join(f"{np.mean(v):>6.2f}" for v in totals.values()))
+
+    queries = [query for _, query in PARAPHRASES]
+    print(f"\nint8 vs float32 recall@{args.k}: {quantization_recall(index, queries, args.k):.3f}\n")
+
+    rng = random.Random(0)
+    picks = [rng.choice(queries) for _ in range(args.iterations)]
+    for mode in ("token", "bm25", "hybrid"):
+        latencies = []
+        start = time.perf_counter()
+        for q in picks:
+            t = time.perf_counter()
+            index.search(q, {"budget_max": 1500.0}, args.k, mode=mode)
+            latencies.append(time.perf_counter() - t)
+        print(format_row(f"search[{mode}]", summarize(latencies, time.perf_counter() - start)))
+
+    latencies = []
+    start = time.perf_counter()
+    for lo in range(0, len(picks), args.batch):
+        batch = picks[lo:lo + args.batch]
+        t = time.perf_counter()
+        dense.scores(dense.embed(batch))
+        latencies.append((time.perf_counter() - t) / len(batch))
+    print(format_row(f"dense scores[batch {args.batch}]", summarize(latencies, time.perf_counter() - start)) + "  (per query)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Load driver for the FastAPI app; reports p50/p95/p99 latency and requests per second.
+
+Against a running server:
+    python -m bench.load --url http://127.0.0.1:8000 --concurrency 64 --requests 2000
+
+Fully offline (fake Algolia + fake OpenAI + the app, all in this process):
+    python -m bench.load --inproc --algolia-latency-ms 40 --llm-ttft-ms 300 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from .stages import QUERIES
+from .stats import summarize, format_row
+
+
+def start_inproc(args) -> str:
+    from . import fake_algolia, fake_openai
+
+    fake_algolia.serve(args.algolia_port, args.algolia_latency_ms, args.algolia_jitter_ms, background=True,
+                       slow_fraction=args.algolia_slow_fraction, slow_ms=args.algolia_slow_ms)
+    fake_openai.serve(args.llm_port, args.llm_ttft_ms, args.llm_tokens_per_s, background=True,
+                      max_concurrency=args.llm_max_concurrency)
+    os.environ.update({
+        "ALGOLIA_HOST": f"http://127.0.0.1:{args.algolia_port}",
+        "ALGOLIA_APP_ID": "bench",
+        "ALGOLIA_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+        "OPENAI_API_KEY": "bench",
+    })
+    if args.local_catalog:
+        os.environ.update({"USE_LOCAL_JSON": "true", "LOCAL_JSON_PATH": args.local_catalog})
+
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1", port=args.app_port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    url = f"http://127.0.0.1:{args.app_port}"
+    # Measure a warm worker: catalog index built and upstream connections open
+    while httpx.get(f"{url}/ready").status_code != 200:
+        time.sleep(0.05)
+    return url
+
+
+async def drive(url: str, endpoint: str, concurrency: int, total: int, unique: bool, bypass_cache: bool):
+    rng = random.Random(0)
+    latencies, errors, shed, degraded = [], 0, 0, 0
+    counter = iter(range(total))
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors, shed, degraded
+        for i in counter:
+            query = rng.choice(QUERIES) + (f" #{i}" if unique else "")
+            t = time.perf_counter()
+            try:
+                r = await client.post(endpoint, json={"query": query, "bypass_cache": bypass_cache})
+                await r.aread()
+                if r.status_code in (429, 503):
+                    shed += 1
+                    continue
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - t)
+                if r.headers.get("content-type", "").startswith("application/json") and r.json().get("used_fallback_generator"):
+                    degraded += 1
+            except httpx.HTTPError:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, elapsed), errors, shed, degraded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /recommend")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", default="/recommend")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--unique", action="store_true", help="Make every query distinct to defeat caching")
+    parser.add_argument("--bypass-cache", action="store_true", help="Send bypass_cache=true")
+    parser.add_argument("--inproc", action="store_true", help="Start fake upstreams and the app in this process")
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--algolia-port", type=int, default=8101)
+    parser.add_argument("--algolia-latency-ms", type=float, default=40.0)
+    parser.add_argument("--algolia-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--algolia-slow-fraction", type=float, default=0.0, help="Share of Algolia calls delayed by --algolia-slow-ms")
+    parser.add_argument("--algolia-slow-ms", type=float, default=0.0)
+    parser.add_argument("--llm-port", type=int, default=8102)
+    parser.add_argument("--llm-ttft-ms", type=float, default=300.0)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=0.0)
+    parser.add_argument("--llm-max-concurrency", type=int, default=0, help="Fake OpenAI answers 429 beyond this many calls in flight")
+    parser.add_argument("--local-catalog", help="Serve retrieval from this local catalog instead of fake Algolia")
+    args = parser.parse_args()
+
+    url = start_inproc(args) if args.inproc else args.url
+    stats, errors, shed, degraded = asyncio.run(drive(url, args.endpoint, args.concurrency, args.requests, args.unique, args.bypass_cache))
+    print(format_row(f"{args.endpoint} c={args.concurrency}", stats) + f"  errors={errors} shed={shed} fallback={degraded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Micro-benchmarks for the individual /recommend stages, with no network.
+
+    python -m bench.stages --size 100k
+    python -m bench.stages --catalog data/bestbuy_seo.json --iterations 500
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Callable, List
+
+from .catalog_gen import SIZES, write_catalog
+from .stats import summarize, format_row
+
+QUERIES = [
+    "I want a laptop for programming that is lightweight",
+    "gaming laptop with 32gb ram under $2000",
+    "phone with a great camera for tiktok and instagram",
+    "cheap android phone between $200 and $400",
+    "what is ram?",
+    "ipad for everyday browsing",
+    "thin and portable windows ultrabook for office work",
+    "chromebook for school under $400",
+]
+
+
+def bench(name: str, fn: Callable[[int], object], iterations: int) -> None:
+    latencies: List[float] = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t)
+    print(format_row(name, summarize(latencies, time.perf_counter() - start)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages in-process")
+    parser.add_argument("--catalog", help="Catalog JSON; generated with --size when omitted")
+    parser.add_argument("--size", default="1k", help="Synthetic catalog size: 1k, 100k, 1m or a count")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--hits", type=int, default=24, help="Hits passed to rerank and the prompt builder")
+    args = parser.parse_args()
+
+    path = args.catalog
+    if not path:
+        n = SIZES.get(args.size.lower()) or int(args.size)
+        path = os.path.join(tempfile.gettempdir(), f"bench_catalog_{n}.json")
+        if not os.path.exists(path):
+            write_catalog(path, n)
+
+    # Settings are read at import time
+    os.environ["LOCAL_JSON_PATH"] = path
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    from app.catalog import get_catalog_index
+    from app.intent import extract_slots
+    from app.ranker import rerank
+    from app.generator import build_prompt
+
+    t = time.perf_counter()
+    index = get_catalog_index(path)
+    print(f"{'catalog load + token index':<32} {len(index)} items in {time.perf_counter() - t:.2f}s")
+    t = time.perf_counter()
+    _ = index.bm25
+    print(f"{'bm25 matrix':<32} built in {time.perf_counter() - t:.2f}s")
+    t = time.perf_counter()
+    _ = index.dense
+    print(f"{'dense index':<32} built in {time.perf_counter() - t:.2f}s")
+
+    rng = random.Random(0)
+    queries = [rng.choice(QUERIES) for _ in range(args.iterations)]
+    slots = [extract_slots(q) for q in queries]
+    hits = [index.search(q, None, args.hits)["hits"] for q in QUERIES]
+
+    bench("extract_slots", lambda i: extract_slots(queries[i]), args.iterations)
+    for mode in ("token", "bm25", "hybrid"):
+        bench(f"_search_local[{mode}]", lambda i: index.search(queries[i], {"budget_max": 1500.0}, args.hits, mode=mode), args.iterations)
+    bench(f"rerank[{args.hits} hits]", lambda i: rerank([dict(h) for h in hits[i % len(hits)]], slots[i], queries[i]), args.iterations)
+    bench("build_prompt", lambda i: build_prompt(queries[i], slots[i], hits[i % len(hits)][:10]), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Cold-start budget of a worker: import time of app.main, the heavy modules it must not import, and
+the time to answer /health and /ready.
+
+    python -m bench.startup                          # import budget only; exits 1 when over
+    python -m bench.startup --budget-ms 800 --serve  # also start uvicorn and time /health and /ready
+    USE_LOCAL_JSON=true LOCAL_JSON_PATH=data/synth_100k.json python -m bench.startup --serve
+
+Each measurement runs in a fresh interpreter; the median of --runs is compared with --budget-ms.
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Loaded on first use (see app/warmup.py); importing any of them from app.main is a regression
+DEFERRED = ("openai", "scipy", "sklearn", "nltk", "tiktoken")
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)")
+
+
+def import_profile(module: str):
+    """(cumulative microseconds of `module`, {package: cumulative microseconds}) in a fresh interpreter."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, check=True).stderr
+    total, packages = 0, {}
+    for line in out.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        cumulative, name = int(m.group(2)), m.group(3)
+        if name == module:
+            total = cumulative
+        # A package's own line (each is imported once) includes everything it pulled in
+        elif "." not in name and not module.startswith(name + "."):
+            packages[name] = cumulative
+    return total, packages
+
+
+def loaded_modules(module: str):
+    code = f"import sys, {module}; print(' '.join(sorted({{m.split('.')[0] for m in sys.modules}})))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return set(out.split())
+
+
+def time_to_ready(port: int, timeout: float):
+    """Seconds from launching uvicorn to the first 200 from /health and from /ready."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    health = ready = None
+    body = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while ready is None and time.perf_counter() - start < timeout:
+                for path in ("/health", "/ready"):
+                    if path == "/health" and health is not None:
+                        continue
+                    try:
+                        r = client.get(path)
+                    except httpx.HTTPError:
+                        break
+                    if r.status_code == 200:
+                        if path == "/health":
+                            health = time.perf_counter() - start
+                        else:
+                            ready = time.perf_counter() - start
+                            body = r.json()
+                time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return health, ready, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the worker's import-time budget and cold start")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="Median import time allowed for --module")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="Slowest top-level packages to list")
+    parser.add_argument("--serve", action="store_true", help="Also time /health and /ready of a fresh uvicorn")
+    parser.add_argument("--port", type=int, default=8190)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    totals, profiles = [], []
+    for _ in range(args.runs):
+        total, packages = import_profile(args.module)
+        totals.append(total / 1000)
+        profiles.append(packages)
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.0f}ms over {args.runs} runs (min {min(totals):.0f}ms, budget {args.budget_ms:.0f}ms)")
+    slowest = sorted(profiles[0], key=lambda name: -statistics.median(p.get(name, 0) for p in profiles))
+    for name in slowest[:args.top]:
+        print(f"  {name:<24} {statistics.median(p.get(name, 0) for p in profiles) / 1000:8.1f}ms")
+
+    deferred = sorted(loaded_modules(args.module) & set(DEFERRED))
+    if deferred:
+        print(f"FAIL {args.module} imports {', '.join(deferred)}; they must load on first use")
+    over = median > args.budget_ms
+    if over:
+        print(f"FAIL import time {median:.0f}ms is over the {args.budget_ms:.0f}ms budget")
+
+    if args.serve:
+        health, ready, body = time_to_ready(args.port, args.timeout)
+        fmt = lambda s: "timed out" if s is None else f"{s * 1000:.0f}ms"
+        print(f"uvicorn start to /health 200: {fmt(health)}, to /ready 200: {fmt(ready)}")
+        if body:
+            print(f"  warm-up steps (ms): {body.get('steps_ms')}" + (f", errors: {body['errors']}" if body.get("errors") else ""))
+        if ready is None:
+            over = True
+
+    sys.exit(1 if deferred or over else 0)
+
+
+if __name__ == "__main__":
+    main()
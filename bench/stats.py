@@ -0,0 +1,29 @@
+from typing import Dict, List
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Latencies and elapsed wall time in seconds; reported latencies are milliseconds."""
+    values = sorted(latencies)
+    return {
+        "n": len(values),
+        "rps": len(values) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": (values[-1] * 1000) if values else 0.0,
+    }
+
+
+def format_row(name: str, stats: Dict[str, float]) -> str:
+    return (f"{name:<32} n={stats['n']:<7} {stats['rps']:>10.1f}/s  "
+            f"p50={stats['p50_ms']:>9.3f}ms  p95={stats['p95_ms']:>9.3f}ms  "
+            f"p99={stats['p99_ms']:>9.3f}ms  max={stats['max_ms']:>9.3f}ms")